@@ -0,0 +1,115 @@
+"""
+Compare running 10 modifiers one generator after the other (Modifier.run())
+with the fused chain of the ModifierManager, then the cluster_N modifier with
+the former pickle and MD5 hash of the value points, on generated file data:
+
+    PYTHONPATH=../src python benchmark_modifiers.py
+"""
+import time
+
+from artemisia.batch import ValuePointBatch
+from artemisia.modifier import ModifierManager
+from artemisia.modifier.cluster import get_cluster_modifier, hash_as_int
+
+files_count = 200
+rows_count = 1000
+modifiers_count = 10
+cluster_rows_count = 20000
+cluster_fields_count = 8
+
+
+def get_shift_modifier(index):
+    field = 'shifted_%d' % index
+
+    def shift_modifier(value_point):
+        value_point[field] = value_point['temperature'] + index
+        return value_point
+    return shift_modifier
+
+
+def get_files_data():
+    return [[{'temperature': float(row), 'room': 'room%d' % (row % 7)}
+             for row in range(rows_count)]
+            for file_index in range(files_count)]
+
+
+def get_modifier_manager():
+    modifier_manager = ModifierManager()
+    for index in range(modifiers_count):
+        modifier_manager.add_modifier(get_shift_modifier(index),
+                                      'shifted_%d' % index)
+    return modifier_manager
+
+
+def run_sequentially(modifier_manager, data):
+    for modifier in modifier_manager._modifiers:
+        data = modifier.run(data)
+    return data
+
+
+def run_fused(modifier_manager, data):
+    return modifier_manager.run(data)
+
+
+def get_cluster_value_points(distinct_values):
+    # either every value is distinct or they are repeated along the rows
+    values_count = cluster_rows_count * cluster_fields_count \
+        if distinct_values else 50
+    value_points = []
+    for row in range(cluster_rows_count):
+        value_point = {}
+        for index in range(cluster_fields_count):
+            value = (row * cluster_fields_count + index) % values_count
+            value_point['field_%d' % index] = float(value) if index % 2 \
+                else 'value_%d' % value
+        value_points.append(value_point)
+    return value_points
+
+
+def md5_cluster_modifier(value_point):
+    value_point['cluster_4'] = hash_as_int(value_point) % 4
+    return value_point
+
+
+def measure_cluster(cluster_modifier, distinct_values):
+    value_points = get_cluster_value_points(distinct_values)
+    start = time.time()
+    for value_point in value_points:
+        cluster_modifier(value_point)
+    return time.time() - start
+
+
+def measure(run, get_data):
+    modifier_manager = get_modifier_manager()
+    data = get_data()
+    start = time.time()
+    for element in run(modifier_manager, data):
+        pass
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    data_kinds = [
+        ('value points', lambda: [value_point for file_data in get_files_data()
+                                  for value_point in file_data]),
+        ('file data', get_files_data),
+        ('batches', lambda: [ValuePointBatch.from_value_points(file_data)
+                             for file_data in get_files_data()])]
+    print '%d files of %d rows, %d modifiers' % (files_count, rows_count,
+                                                 modifiers_count)
+    for (name, get_data) in data_kinds:
+        sequential_duration = measure(run_sequentially, get_data)
+        fused_duration = measure(run_fused, get_data)
+        print '%-12s sequential: %.2fs fused: %.2fs (x%.2f)' \
+            % (name, sequential_duration, fused_duration,
+               sequential_duration / fused_duration)
+    print 'cluster_4 over %d value points of %d fields' \
+        % (cluster_rows_count, cluster_fields_count)
+    for (name, distinct_values) in [('repeated', False),
+                                    ('distinct', True)]:
+        md5_duration = measure_cluster(md5_cluster_modifier, distinct_values)
+        stable_hash_duration = measure_cluster(
+            get_cluster_modifier('cluster_4'), distinct_values)
+        print '%-12s md5: %.2fs stable_hash: %.2fs (x%.2f)' \
+            % (name, md5_duration, stable_hash_duration,
+               md5_duration / stable_hash_duration)
@@ -12,4 +12,7 @@ def get_version_number_modifier():
             version_number = 0
         value_point['version_number'] = version_number
         return value_point
+    system_number_modifier.input_fields = ['system']
+    system_number_modifier.output_fields = ['version_number']
+    system_number_modifier.keeps_value_points = True
     return system_number_modifier
\ No newline at end of file
@@ -1,3 +1,4 @@
+import os
 import argparse
 
 import artemisia.dataloader as dataloader
@@ -7,6 +8,8 @@ import artemisia.viewer as gviewer
 from artemisia import helper as ghelper
 import artemisia.registry as registry
 import artemisia.exporter
+import artemisia.aggregator as gaggregator
+from artemisia.modifier.normalizer import Normalizer
 
 class Artemisia:
 
@@ -17,8 +20,25 @@ class Artemisia:
         self._parse_args()
         self._filter_manager = None
         self._modifier_manager = None
+        self._data_loader = None
 
     def run(self):
+        if self._args.subparser_name == 'cache':
+            self._run_cache_command()
+            return
+        if self._args.subparser_name == 'schema':
+            self._run_schema_command()
+            return
+        if self._args.subparser_name == 'convert':
+            self._run_convert_command()
+            return
+
+        gaggregator.AggregatorFactory.set_default_backend(
+            self._args.aggregation_backend)
+        dataloader.DataLoader.set_discovery(
+            self._args.recursive, self._args.include_patterns,
+            self._args.exclude_patterns, self._args.file_index)
+        Normalizer.set_cache_dir_path(self._args.normalization_dir)
         preprocessed_data_processor = self._get_preprocessed_data_generator()
 
         if self._args.subparser_name == 'export':
@@ -35,6 +55,42 @@ class Artemisia:
                    color_column=self._args.color, scatter=self._args.scatter,
                    output_file_name=self._args.output)
 
+    def _run_cache_command(self):
+        cache = dataloader.cache.ParsedDataCache(self._args.cache_dir)
+        if self._args.action == 'clear':
+            print str(cache.clear()) + ' cache entries removed'
+            return
+        statistics = cache.get_statistics()
+        print 'entries: ' + str(statistics['entries'])
+        print 'size: ' + str(statistics['size']) + ' bytes'
+
+    def _run_schema_command(self):
+        schema = dataloader.DataLoader().infer_schema(self._args.input)
+        schema.save(self._args.output)
+        print str(len(schema.get_types())) + ' fields written to ' \
+            + self._args.output
+
+    def _run_convert_command(self):
+        # the loader package may register casts
+        gmodifier.ModifierManager().add_lookup_module(self._args.loader)
+        column_store_class = dataloader.column_store.ColumnStore
+        data_loader = dataloader.DataLoader()
+        data_loader.set_batch_mode(True)
+        if not os.path.isdir(self._args.output):
+            os.makedirs(self._args.output)
+        converted_files_count = 0
+        for file_path in data_loader.list_data_files(self._args.input):
+            if column_store_class.is_store(file_path):
+                continue
+            store_name = os.path.splitext(os.path.basename(file_path))[0] \
+                + column_store_class.extension
+            column_store_class.write(
+                os.path.join(self._args.output, store_name),
+                data_loader.extract_batch_from_file(file_path))
+            converted_files_count += 1
+        print str(converted_files_count) + ' data files converted to ' \
+            + self._args.output
+
     def get_data_dir_path(self):
         return self._args.input
 
@@ -49,6 +105,9 @@ class Artemisia:
                                                 help='commands')
         self._add_plot_subparser(subparsers)
         self._add_export_subparser(subparsers)
+        self._add_cache_subparser(subparsers)
+        self._add_schema_subparser(subparsers)
+        self._add_convert_subparser(subparsers)
 
         return main_parser
 
@@ -94,11 +153,50 @@ class Artemisia:
         export_subparser.add_argument("-t", action="store", dest="type",
                                       default='csv',
                                       help="The type to which export "
-                                           "(csv / arff)")
+                                           "(csv / arff / npz / feather / "
+                                           "parquet)")
         export_subparser.add_argument("-o", action="store", dest="output",
                                       default='export.arff',
                                       help="The file to which exports")
 
+    def _add_cache_subparser(self, subparsers):
+        cache_subparser = subparsers.add_parser('cache')
+        cache_subparser.add_argument("action", choices=['stats', 'clear'],
+                                     help="Show statistics about the parsed "
+                                          "data cache or remove its entries")
+        cache_subparser.add_argument("--cache-dir", action="store",
+                                     dest="cache_dir", required=True,
+                                     help="The parsed data cache directory")
+
+    def _add_schema_subparser(self, subparsers):
+        schema_subparser = subparsers.add_parser('schema')
+        schema_subparser.add_argument("-i", action="store", dest="input",
+                                      required=True,
+                                      help="The directory containing the "
+                                           "data files")
+        schema_subparser.add_argument("-o", action="store", dest="output",
+                                      default='schema.json',
+                                      help="The file to which the schema "
+                                           "inferred from the first data "
+                                           "files is written")
+
+    def _add_convert_subparser(self, subparsers):
+        convert_subparser = subparsers.add_parser('convert')
+        convert_subparser.add_argument("-i", action="store", dest="input",
+                                       required=True,
+                                       help="The directory containing the "
+                                            "data files")
+        convert_subparser.add_argument("-o", action="store", dest="output",
+                                       required=True,
+                                       help="The directory to which the data "
+                                            "files are written as column "
+                                            "stores")
+        convert_subparser.add_argument("-l", action="store", dest="loader",
+                                       default=None,
+                                       help="A python package to use as "
+                                            "loader (casts are applied while "
+                                            "converting)")
+
     def _add_generic_arguments(self, parser):
         parser.add_argument("-m", action="append", dest="matches", default=[],
                             help="Consider the first element of a simulation "
@@ -110,6 +208,97 @@ class Artemisia:
                             help="A python package to use as loader")
         parser.add_argument("-i", action="store", dest="input", default='./',
                             help="The input dir to consider (mandatory)")
+        parser.add_argument("--recursive", action="store_true",
+                            dest="recursive", default=False,
+                            help="Look for the data files in the "
+                                 "subdirectories of the input dir too")
+        parser.add_argument("--include", action="append",
+                            dest="include_patterns", default=None,
+                            help="Only consider the data files matching this "
+                                 "pattern (relative to the input dir, "
+                                 "default: *.csv and *.columns)")
+        parser.add_argument("--exclude", action="append",
+                            dest="exclude_patterns", default=None,
+                            help="Ignore the data files and the directories "
+                                 "matching this pattern")
+        parser.add_argument("--file-index", action="store", dest="file_index",
+                            default=None,
+                            help="A file where the listing of the input dir "
+                                 "is kept, only the directories that changed "
+                                 "are listed again by the next runs")
+        parser.add_argument("-j", action="store", dest="jobs", default=1,
+                            type=int,
+                            help="The number of processes used to load the "
+                                 "data files")
+        parser.add_argument("--unordered", action="store_false",
+                            dest="preserve_order", default=True,
+                            help="With -j, let the data files be processed in "
+                                 "the order they are loaded")
+        parser.add_argument("--modifier-jobs", action="store",
+                            dest="modifier_jobs", default=1, type=int,
+                            help="The number of processes running the "
+                                 "modifiers, each one loads them again from "
+                                 "the loader package")
+        parser.add_argument("-b", action="store_true", dest="batch",
+                            default=False,
+                            help="Process the data of each file as columnar "
+                                 "batches rather than line by line")
+        parser.add_argument("-a", action="store", dest="aggregation_backend",
+                            default='sqlite',
+                            choices=['sqlite', 'numpy', 'streaming'],
+                            help="The backend used to aggregate the data, "
+                                 "numpy and streaming (constant memory per "
+                                 "group) only support COUNT, AVG, MIN, MAX, "
+                                 "SUM and STDDEV")
+        parser.add_argument("--cache-dir", action="store", dest="cache_dir",
+                            default=None,
+                            help="A directory where parsed data files are "
+                                 "cached, only new or changed files are "
+                                 "parsed again")
+        parser.add_argument("--normalization-dir", action="store",
+                            dest="normalization_dir", default=None,
+                            help="A directory where the statistics of the "
+                                 "normalized fields are kept (the temporary "
+                                 "directory by default)")
+        parser.add_argument("--schema", action="store", dest="schema",
+                            default=None,
+                            help="A schema file (see the schema command) "
+                                 "telling which fields are numbers, instead "
+                                 "of inferring it from the first files")
+        parser.add_argument("--parser", action="store", dest="parser",
+                            default='python', choices=['python', 'pandas'],
+                            help="The CSV parser, pandas reads whole files "
+                                 "with its C parser (python is used if "
+                                 "pandas is not installed)")
+
+    def _get_configured_data_loader(self):
+        if self._data_loader is not None:
+            return self._data_loader
+        data_loader = dataloader.DataLoader()
+        data_loader.set_workers_count(self._args.jobs)
+        data_loader.set_preserve_order(self._args.preserve_order)
+        data_loader.set_batch_mode(self._args.batch)
+        data_loader.set_parser(self._args.parser)
+        data_loader.set_cache_dir_path(self._args.cache_dir)
+        if self._args.schema is not None:
+            data_loader.set_schema(
+                dataloader.schema.Schema.load(self._args.schema))
+        # filters (and matches) on columns no modifier computes are applied
+        # while loading, unless a modifier may alter other columns or drop
+        # value points
+        filter_manager = self._get_configured_filter_manager()
+        modifier_manager = self._get_configured_modifier_manager()
+        pushed_down_columns = None
+        if modifier_manager.can_push_down_filters():
+            pushed_down_columns = modifier_manager.get_modified_columns()
+        data_loader.set_filter_manager(
+            filter_manager.push_down(pushed_down_columns),
+            filter_manager.filters_files())
+        data_loader.set_first_to_match_filters(
+            filter_manager.get_selection_filters(pushed_down_columns))
+        data_loader.set_projection(self._get_projection())
+        self._data_loader = data_loader
+        return data_loader
 
     def _get_configured_modifier_manager(self):
         if self._modifier_manager is not None:
@@ -117,6 +306,7 @@ class Artemisia:
         modifier_manager = gmodifier.ModifierManager()
         modifier_manager.add_lookup_module(self._args.loader)
         modifier_manager.load_modifiers_from_columns(self._get_columns())
+        modifier_manager.set_workers_count(self._args.modifier_jobs)
         self._modifier_manager = modifier_manager
         return modifier_manager
 
@@ -132,7 +322,7 @@ class Artemisia:
         return filter_manager
 
     def _get_preprocessed_data_generator(self):
-        loader = dataloader.DataLoader()
+        loader = self._get_configured_data_loader()
         file_data_generator = loader.extract_from_path(self.get_data_dir_path())
 
         modified_generator = self._get_configured_modifier_manager() \
@@ -148,6 +338,20 @@ class Artemisia:
         columns += self._get_extra_columns()
         return ghelper.Helper().clean_columns(columns)
 
+    def _get_projection(self):
+        """
+        The fields to load from the data files, None when any field may be
+        needed
+        """
+        if (self._args.subparser_name == 'export') \
+                and (len(self._get_export_extra_columns()) == 0):
+            return None  # every column is exported
+        input_fields = \
+            self._get_configured_modifier_manager().get_input_fields()
+        if input_fields is None:
+            return None
+        return self._get_columns() + input_fields
+
     def _get_extra_columns(self):
         subparser_name = self._args.subparser_name
         if subparser_name == 'plot':
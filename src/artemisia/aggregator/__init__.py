@@ -1,8 +1,11 @@
 import sqlite3
 import re
+import math
 import types
 import numpy
 
+from artemisia.batch import ValuePointBatch
+
 
 class Aggregator:
     """
@@ -12,8 +15,10 @@ class Aggregator:
 
     def __init__(self):
         self._aggregate_columns = []
-        self._target_value = 'COUNT(*)'
+        self._target_values = ['COUNT(*)']
         self._table_name = 'data_point'
+        self._insert_chunk_size = 5000
+        self._insert_buffer = []
 
         self._target_value_pattern = '(\w*)\s*\(\s*([\w\*]+)\s*\)'
 
@@ -32,7 +37,20 @@ class Aggregator:
         """
         Set the target value, default is 'COUNT(*)'
         """
-        self._target_value = target_value
+        self._target_values = [target_value]
+
+    def set_target_values(self, target_values):
+        """
+        Set several target values computed in the same pass over the data,
+        the first one is the one returned as 'aggregate'
+        """
+        self._target_values = target_values[:]
+
+    def add_target_value(self, target_value):
+        """
+        Add a target value computed in the same pass as the other ones
+        """
+        self._target_values.append(target_value)
 
     def aggregate(self, data_generator = None):
         """
@@ -41,7 +59,7 @@ class Aggregator:
         if data_generator is not None:
             self._init_database()
             self._load_from_generator(data_generator)
-            self._connection.commit()
+            self._end_loading()
         return self._query_aggregate()
 
     def aggregate_matrix(self, data_generator):
@@ -56,7 +74,12 @@ class Aggregator:
 
     def _init_database(self):
         self._connection = sqlite3.connect(':memory:')
+        self._connection.text_factory = str
         self._connection.create_aggregate("STDDEV", 1, StdDevAggregate)
+        # the database only lives for one aggregation, nothing to recover
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._insert_buffer = []
 
         create_statement = 'CREATE TABLE ' + self._table_name + '''
                             (id INTEGER PRIMARY KEY, '''\
@@ -65,9 +88,10 @@ class Aggregator:
         self._connection.execute(create_statement)
 
     def _get_columns_declaration(self):
-        column_declaration_units = [column_name + ' VARCHAR(50)' for column_name in self._aggregate_columns]
-        target_column = self._get_target_column()
-        if target_column is not None:
+        # no declared type: values are stored as they are bound, so numbers
+        # stay numbers and strings stay strings
+        column_declaration_units = self._aggregate_columns[:]
+        for target_column in self._get_target_columns():
             column_declaration_units.append(target_column + ' FLOAT')
         return ', '.join(column_declaration_units)
 
@@ -78,6 +102,8 @@ class Aggregator:
             elif isinstance(file_data, types.ListType):
                 for value_point in file_data:
                     self._load_value_point(value_point)
+            elif isinstance(file_data, ValuePointBatch):
+                self._load_batch(file_data)
             else:
                 raise Exception("Unexcepted type")
 
@@ -86,19 +112,62 @@ class Aggregator:
         # A crash in the line below may mean that one of the column doesn't
         # exist in the value point
         try:
-            values = ['\'' + str(value_point[column]) + '\'' for column in columns]
-            insert_statement = 'INSERT INTO ' + self._table_name + ' (id, ' \
-                               + ', '.join(columns) \
-                               + ') VALUES (null, ' + ', '.join(values) + ')'
-            self._connection.execute(insert_statement)
+            values = [self._get_sql_value(value_point[column])
+                      for column in columns]
         except KeyError as e:
             message = 'A value point has been ignored since not field ' \
                       + str(e) + ' can be found' + "\n"
             # @todo do something with message if needed ...
+            return
+        self._insert_buffer.append(values)
+        if len(self._insert_buffer) >= self._insert_chunk_size:
+            self._flush_insert_buffer()
+
+    def _load_batch(self, batch):
+        columns = self._get_columns()
+        if not all(batch.has_field(column) for column in columns):
+            # same as the KeyError case of _load_value_point
+            return
+        columns_values = [batch.get_column(column).tolist()
+                          for column in columns]
+        for row in zip(*columns_values):
+            if None in row:
+                continue
+            self._insert_buffer.append([self._get_sql_value(value)
+                                        for value in row])
+        if len(self._insert_buffer) >= self._insert_chunk_size:
+            self._flush_insert_buffer()
+
+    def _end_loading(self):
+        self._flush_insert_buffer()
+        self._connection.commit()
+
+    def _flush_insert_buffer(self):
+        if len(self._insert_buffer) == 0:
+            return
+        self._connection.executemany(self._get_insert_statement(),
+                                     self._insert_buffer)
+        self._insert_buffer = []
+
+    def _get_insert_statement(self):
+        columns = self._get_columns()
+        return 'INSERT INTO ' + self._table_name + ' (id, ' \
+               + ', '.join(columns) + ') VALUES (null, ' \
+               + ', '.join(['?'] * len(columns)) + ')'
+
+    def _get_sql_value(self, value):
+        if isinstance(value, (types.StringTypes, types.IntType,
+                              types.LongType, types.FloatType)):
+            return value
+        if isinstance(value, numpy.generic):
+            return value.item()
+        if value is None:
+            return None
+        return str(value)
 
     def _query_aggregate(self):
         columns = self._aggregate_columns[:]
-        queried_columns = columns + [self._target_value]
+        queried_columns = columns + self._target_values
         aggregate_statement = 'SELECT ' + ', '.join(queried_columns)\
                                     + ' FROM ' + self._table_name
         if len(columns) != 0:
@@ -106,30 +175,41 @@ class Aggregator:
 
         cursor = self._connection.cursor()
         cursor.execute(aggregate_statement)
-        keys = columns + ['aggregate']
+        keys = columns + self._target_values
         for aggregate_data_line in cursor:
-            def try_float(x):
-                try:
-                    return float(x)
-                except ValueError:
-                    return x
-            aggregate_data_line = map(try_float, aggregate_data_line)
-            aggregate_data_dict = dict(zip(keys, aggregate_data_line))
-            # we duplicate the value, that will ease the parsing
-            aggregate_data_dict[self._target_value] = \
-                aggregate_data_dict['aggregate']
-            yield aggregate_data_dict
+            yield self._get_aggregate_dict(keys, aggregate_data_line)
+
+    def _get_aggregate_dict(self, keys, aggregate_data_line):
+        def try_float(x):
+            try:
+                return float(x)
+            except (ValueError, TypeError):
+                return x
+        aggregate_data_line = map(try_float, aggregate_data_line)
+        aggregate_data_dict = dict(zip(keys, aggregate_data_line))
+        # we duplicate the value, that will ease the parsing
+        aggregate_data_dict['aggregate'] = \
+            aggregate_data_dict[self._target_values[0]]
+        return aggregate_data_dict
 
     def _get_columns(self):
         columns = self._aggregate_columns[:]
-        target_column = self._get_target_column()
-        if target_column is not None:
-            columns.append(target_column)
+        columns += self._get_target_columns()
         return columns
 
-    def _get_target_column(self, target_value_string=None):
-        if target_value_string is None:
-            target_value_string = self._target_value
+    def _get_target_columns(self):
+        """
+        The distinct columns used by the target values
+        """
+        target_columns = []
+        for target_value in self._target_values:
+            target_column = self._get_target_column(target_value)
+            if (target_column is not None) \
+                    & (target_column not in target_columns):
+                target_columns.append(target_column)
+        return target_columns
+
+    def _get_target_column(self, target_value_string):
         result = re.search(self._target_value_pattern,
                            target_value_string)
         if result is None:
@@ -156,6 +236,59 @@ class Aggregator:
 
 
 
+class RunningStatistics:
+    """
+    Statistics over a stream of values kept in constant memory, the standard
+    deviation uses Welford's algorithm
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if (self.min is None) or (value < self.min):
+            self.min = value
+        if (self.max is None) or (value > self.max):
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, count, total, minimum, maximum, mean, m2):
+        """
+        Merge the statistics of another set of values (Chan et al. update)
+        """
+        if count == 0:
+            return
+        if self.count == 0:
+            (self.count, self.sum, self.min, self.max, self.mean, self.m2) = \
+                (count, total, minimum, maximum, mean, m2)
+            return
+        merged_count = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / merged_count
+        self.mean += delta * count / merged_count
+        self.count = merged_count
+        self.sum += total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def get_stddev(self):
+        """
+        The population standard deviation (as numpy.std), None without values
+        """
+        if self.count == 0:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+
 class StdDevAggregate:
     """
     Some libraries are available but we only need an aggregate for StdDev...
@@ -163,10 +296,43 @@ class StdDevAggregate:
     """
 
     def __init__(self):
-        self.values = []
+        self.statistics = RunningStatistics()
 
     def step(self, value):
-        self.values.append(value)
+        if value is None:
+            return
+        self.statistics.add(float(value))
 
     def finalize(self):
-        return numpy.std(self.values)
\ No newline at end of file
+        return self.statistics.get_stddev()
+
+
+class AggregatorFactory:
+    """
+    Build the aggregator matching the configured backend:
+
+      * sqlite, the default, supports any SQL aggregate function
+      * numpy, computes COUNT, AVG, MIN, MAX, SUM and STDDEV in memory
+      * streaming, computes the same functions keeping only running
+        statistics per group
+    """
+    _default_backend = 'sqlite'
+
+    @staticmethod
+    def set_default_backend(backend):
+        AggregatorFactory._default_backend = backend.lower()
+
+    def get_aggregator(self, backend=None):
+        if backend is None:
+            backend = AggregatorFactory._default_backend
+        backend = backend.lower()
+        if backend == 'sqlite':
+            return Aggregator()
+        if backend == 'numpy':
+            from artemisia.aggregator.numpy_aggregator import NumpyAggregator
+            return NumpyAggregator()
+        if backend == 'streaming':
+            from artemisia.aggregator.streaming_aggregator import \
+                StreamingAggregator
+            return StreamingAggregator()
+        raise Exception('Unexpected aggregation backend ' + backend)
@@ -0,0 +1,177 @@
+import re
+import numpy
+
+from artemisia.aggregator import Aggregator
+from artemisia.batch import to_array
+
+
+class NumpyAggregator(Aggregator):
+    """
+    This aggregator has the same API as the Aggregator but keeps the values in
+    memory and computes the aggregate with numpy instead of going through
+    sqlite. Only the usual aggregate functions are supported.
+    """
+    _aggregate_functions = ['COUNT', 'AVG', 'MIN', 'MAX', 'SUM', 'STDDEV']
+
+    def __init__(self):
+        Aggregator.__init__(self)
+        self._values = None
+        self._rows_count = 0
+        self._target_column_data = {}
+
+    def _init_database(self):
+        self._get_target_functions()  # fail early on unsupported functions
+        self._values = [[] for column in self._get_columns()]
+        self._rows_count = 0
+        self._insert_buffer = []
+
+    def _end_loading(self):
+        self._flush_insert_buffer()
+
+    def _flush_insert_buffer(self):
+        for (index, values) in enumerate(self._values):
+            values.extend([row[index] for row in self._insert_buffer])
+        self._rows_count += len(self._insert_buffer)
+        self._insert_buffer = []
+
+    def _query_aggregate(self):
+        columns = self._aggregate_columns[:]
+        keys = columns + self._target_values
+        (group_ids, group_keys) = self._get_groups()
+        self._target_column_data = {}
+        targets_aggregate_values = [
+            self._get_aggregate_values(function, target_column, group_ids,
+                                       len(group_keys))
+            for (function, target_column) in self._get_target_functions()]
+        for (index, group_key) in enumerate(group_keys):
+            aggregate_values = [aggregate_values[index] for aggregate_values
+                                in targets_aggregate_values]
+            yield self._get_aggregate_dict(keys,
+                                           list(group_key) + aggregate_values)
+
+    def _get_target_functions(self):
+        """
+        Return, for each target value, the upper cased function name and its
+        target column (None for '*')
+        """
+        target_functions = []
+        for target_value in self._target_values:
+            result = re.search('^\s*' + self._target_value_pattern + '\s*$',
+                               target_value)
+            if result is None:
+                raise Exception('The numpy aggregator can not compute '
+                                + target_value)
+            function = result.group(1).upper()
+            if function not in NumpyAggregator._aggregate_functions:
+                raise Exception('The numpy aggregator does not support '
+                                + function + ', use the sqlite one')
+            if (result.group(2) == '*') & (function != 'COUNT'):
+                raise Exception('Unexpected target value ' + target_value)
+            target_functions.append(
+                (function, self._get_target_column(target_value)))
+        return target_functions
+
+    def _get_groups(self):
+        """
+        Return the group id of each stored value point and the key (tuple of
+        the aggregate column values) of each group, ordered like sqlite does
+        """
+        columns_count = len(self._aggregate_columns)
+        return self._get_groups_from_columns(self._values[:columns_count],
+                                             self._rows_count)
+
+    def _get_groups_from_columns(self, columns_values, rows_count):
+        if len(columns_values) == 0:
+            return (numpy.zeros(rows_count, dtype=numpy.int64), [()])
+        if rows_count == 0:
+            return (numpy.zeros(0, dtype=numpy.int64), [])
+        codes = numpy.zeros(rows_count, dtype=numpy.int64)
+        columns_distinct_values = []
+        for column_values in columns_values:
+            if not isinstance(column_values, numpy.ndarray):
+                column_values = to_array(column_values)
+            (distinct_values, column_codes) = numpy.unique(
+                column_values, return_inverse=True)
+            codes = codes * len(distinct_values) + column_codes
+            columns_distinct_values.append(distinct_values.tolist())
+        (distinct_codes, group_ids) = numpy.unique(codes,
+                                                   return_inverse=True)
+        group_keys = []
+        for code in distinct_codes.tolist():
+            group_key = []
+            for distinct_values in reversed(columns_distinct_values):
+                (code, value_index) = divmod(code, len(distinct_values))
+                group_key.insert(0, distinct_values[value_index])
+            group_keys.append(tuple(group_key))
+        return (group_ids, group_keys)
+
+    def _get_aggregate_values(self, function, target_column, group_ids,
+                              groups_count):
+        if target_column is None:
+            return numpy.bincount(group_ids, minlength=groups_count).tolist()
+
+        (values, group_ids, counts, sums) = \
+            self._get_target_column_data(target_column, group_ids,
+                                         groups_count)
+        if function == 'COUNT':
+            return counts.tolist()
+
+        if function == 'SUM':
+            aggregate_values = sums
+        elif function == 'AVG':
+            aggregate_values = sums / numpy.maximum(counts, 1)
+        elif function == 'STDDEV':
+            averages = sums / numpy.maximum(counts, 1)
+            deviations = values - averages[group_ids]
+            variances = numpy.bincount(group_ids, weights=deviations ** 2,
+                                       minlength=groups_count)
+            aggregate_values = numpy.sqrt(variances / numpy.maximum(counts, 1))
+        else:
+            aggregate_values = self._get_extremum_values(
+                function, values, group_ids, groups_count)
+        aggregate_values = aggregate_values.tolist()
+        # like in SQL, aggregating nothing returns NULL
+        return [aggregate_value if count != 0 else None
+                for (aggregate_value, count)
+                in zip(aggregate_values, counts.tolist())]
+
+    def _get_target_column_data(self, target_column, group_ids,
+                                groups_count):
+        """
+        The defined values of a target column with their group ids, counts and
+        sums per group, computed once for all the targets using the column
+        """
+        if target_column in self._target_column_data:
+            return self._target_column_data[target_column]
+        target_values = self._values[self._get_columns().index(target_column)]
+        is_defined = numpy.array([value is not None
+                                  for value in target_values], dtype=bool)
+        try:
+            values = numpy.array([value for value in target_values
+                                  if value is not None], dtype=float)
+        except ValueError:
+            raise Exception('The numpy aggregator only aggregates numeric '
+                            'values, ' + target_column + ' is not')
+        group_ids = group_ids[is_defined]
+        counts = numpy.bincount(group_ids, minlength=groups_count)
+        sums = numpy.bincount(group_ids, weights=values,
+                              minlength=groups_count)
+        column_data = (values, group_ids, counts, sums)
+        self._target_column_data[target_column] = column_data
+        return column_data
+
+    def _get_extremum_values(self, function, values, group_ids,
+                             groups_count):
+        extremum_values = numpy.zeros(groups_count)
+        if len(values) == 0:
+            return extremum_values
+        order = numpy.argsort(group_ids, kind='mergesort')
+        sorted_group_ids = group_ids[order]
+        starts = numpy.flatnonzero(numpy.diff(sorted_group_ids)) + 1
+        starts = numpy.concatenate(([0], starts))
+        if function == 'MIN':
+            reduced = numpy.minimum.reduceat(values[order], starts)
+        else:
+            reduced = numpy.maximum.reduceat(values[order], starts)
+        extremum_values[sorted_group_ids[starts]] = reduced
+        return extremum_values
@@ -0,0 +1,171 @@
+import types
+import numpy
+
+from artemisia.aggregator import RunningStatistics
+from artemisia.aggregator.numpy_aggregator import NumpyAggregator
+
+
+class StreamingAggregator(NumpyAggregator):
+    """
+    This aggregator supports the same functions as the NumpyAggregator but only
+    keeps running statistics per group while consuming the data, its memory
+    usage grows with the number of groups rather than with the number of
+    value points.
+    """
+
+    def __init__(self):
+        NumpyAggregator.__init__(self)
+        self._groups = {}
+
+    def _init_database(self):
+        self._get_target_functions()  # fail early on unsupported functions
+        self._groups = {}
+
+    def _end_loading(self):
+        pass
+
+    def _load_value_point(self, value_point):
+        try:
+            group_key = tuple([value_point[column]
+                               for column in self._aggregate_columns])
+            values = [value_point[column]
+                      for column in self._get_target_columns()]
+        except KeyError:
+            # as with the other aggregators, the value point is ignored
+            return
+        group = self._get_group(group_key)
+        group.rows_count += 1
+        for (statistics, value) in zip(group.columns_statistics, values):
+            if value is None:
+                continue
+            statistics.add(self._get_float(value))
+
+    def _load_batch(self, batch):
+        columns = self._get_columns()
+        if not all(batch.has_field(column) for column in columns):
+            return
+        is_defined = numpy.ones(len(batch), dtype=bool)
+        for column in columns:
+            column_values = batch.get_column(column)
+            if column_values.dtype == object:
+                is_defined &= numpy.array([value is not None
+                                           for value in column_values],
+                                          dtype=bool)
+        batch = batch.select(is_defined)
+        (group_ids, group_keys) = self._get_groups_from_columns(
+            [batch.get_column(column) for column in self._aggregate_columns],
+            len(batch))
+        groups_count = len(group_keys)
+        groups = [self._get_group(group_key) for group_key in group_keys]
+        for (group, rows_count) in \
+                zip(groups, numpy.bincount(group_ids,
+                                           minlength=groups_count).tolist()):
+            group.rows_count += rows_count
+        for (index, column) in enumerate(self._get_target_columns()):
+            try:
+                values = batch.get_column(column).astype(float)
+            except ValueError:
+                raise Exception('The streaming aggregator only aggregates '
+                                'numeric values, ' + column + ' is not')
+            self._merge_batch_statistics(
+                [group.columns_statistics[index] for group in groups],
+                values, group_ids, groups_count)
+
+    def _merge_batch_statistics(self, groups_statistics, values, group_ids,
+                                groups_count):
+        counts = numpy.bincount(group_ids, minlength=groups_count)
+        sums = numpy.bincount(group_ids, weights=values,
+                              minlength=groups_count)
+        means = sums / numpy.maximum(counts, 1)
+        deviations = values - means[group_ids]
+        m2s = numpy.bincount(group_ids, weights=deviations ** 2,
+                             minlength=groups_count)
+        minimums = self._get_extremum_values('MIN', values, group_ids,
+                                             groups_count)
+        maximums = self._get_extremum_values('MAX', values, group_ids,
+                                             groups_count)
+        for (statistics, count, total, minimum, maximum, mean, m2) in \
+                zip(groups_statistics, counts.tolist(), sums.tolist(),
+                    minimums.tolist(), maximums.tolist(), means.tolist(),
+                    m2s.tolist()):
+            statistics.merge(count, total, minimum, maximum, mean, m2)
+
+    def _query_aggregate(self):
+        columns = self._aggregate_columns[:]
+        keys = columns + self._target_values
+        target_functions = self._get_target_functions()
+        target_columns = self._get_target_columns()
+        group_keys = sorted(self._groups.keys(), key=self._get_sql_order)
+        if (len(columns) == 0) & (len(group_keys) == 0):
+            # like SQL, aggregating nothing still gives a line
+            group_keys = [()]
+            self._get_group(())
+        for group_key in group_keys:
+            group = self._groups[group_key]
+            aggregate_values = []
+            for (function, target_column) in target_functions:
+                if target_column is None:
+                    aggregate_values.append(group.rows_count)
+                    continue
+                statistics = group.columns_statistics[
+                    target_columns.index(target_column)]
+                aggregate_values.append(
+                    self._get_statistics_value(function, statistics))
+            yield self._get_aggregate_dict(keys,
+                                           list(group_key) + aggregate_values)
+
+    def _get_statistics_value(self, function, statistics):
+        if function == 'COUNT':
+            return statistics.count
+        if statistics.count == 0:
+            return None
+        if function == 'SUM':
+            return statistics.sum
+        if function == 'AVG':
+            return statistics.mean
+        if function == 'MIN':
+            return statistics.min
+        if function == 'MAX':
+            return statistics.max
+        return statistics.get_stddev()
+
+    def _get_group(self, group_key):
+        group = self._groups.get(group_key, None)
+        if group is None:
+            group = GroupStatistics(len(self._get_target_columns()))
+            self._groups[group_key] = group
+        return group
+
+    def _get_sql_order(self, group_key):
+        """
+        Sort key ordering the groups as sqlite does: NULL, numbers, strings
+        """
+        order = []
+        for value in group_key:
+            if value is None:
+                order.append((0, None))
+            elif isinstance(value, (types.IntType, types.LongType,
+                                    types.FloatType)):
+                order.append((1, value))
+            else:
+                order.append((2, value))
+        return order
+
+    def _get_float(self, value):
+        try:
+            return float(value)
+        except ValueError:
+            raise Exception('The streaming aggregator only aggregates numeric '
+                            'values, ' + str(value) + ' is not')
+
+
+class GroupStatistics:
+    """
+    The running statistics of a group: its value points count and the
+    statistics of each target column
+    """
+
+    def __init__(self, columns_count):
+        self.rows_count = 0
+        self.columns_statistics = [RunningStatistics()
+                                   for index in range(columns_count)]
@@ -0,0 +1,160 @@
+import types
+import numpy
+
+
+class ValuePointBatch:
+    """
+    This class stores the value points of a file column by column (one numpy
+    array per field). It behaves like a read only list of value points
+    (dictionaries) so that the code working on dictionaries can still consume
+    it, while the vectorized code works on the columns directly.
+
+    Missing fields are stored as None and are left out of the dictionaries.
+    """
+
+    def __init__(self, columns=None, fields=None, length=None):
+        self._columns = columns or {}
+        self._fields = fields or sorted(self._columns.keys())
+        if length is None:
+            length = 0
+            if len(self._fields) != 0:
+                length = len(self._columns[self._fields[0]])
+        self._length = length
+
+    @staticmethod
+    def from_value_points(value_points):
+        """
+        Build a batch from a list of value points (dictionaries)
+        """
+        fields = []
+        known_fields = set()
+        for value_point in value_points:
+            for field in value_point.iterkeys():
+                if field not in known_fields:
+                    known_fields.add(field)
+                    fields.append(field)
+        columns = {}
+        for field in fields:
+            values = [value_point.get(field) for value_point in value_points]
+            columns[field] = to_array(values)
+        return ValuePointBatch(columns, fields, len(value_points))
+
+    @staticmethod
+    def concatenate(batches):
+        """
+        Build a batch from the value points of several batches, in order
+        """
+        fields = []
+        for batch in batches:
+            fields += [field for field in batch.get_fields()
+                       if field not in fields]
+        columns = {}
+        for field in fields:
+            columns[field] = numpy.concatenate(
+                [batch.get_column(field) if batch.has_field(field)
+                 else to_array([None] * len(batch)) for batch in batches])
+        return ValuePointBatch(columns, fields,
+                               sum(len(batch) for batch in batches))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for value_point in self.to_value_points():
+            yield value_point
+
+    def __getitem__(self, index):
+        if isinstance(index, types.SliceType):
+            return self.select(numpy.arange(self._length)[index])
+        if index < 0:
+            index += self._length
+        if (index < 0) | (index >= self._length):
+            raise IndexError('Batch index out of range')
+        value_point = {}
+        for field in self._fields:
+            value = self._columns[field][index:index + 1].tolist()[0]
+            if value is not None:
+                value_point[field] = value
+        return value_point
+
+    def get_fields(self):
+        return self._fields[:]
+
+    def has_field(self, field):
+        return field in self._columns
+
+    def get_column(self, field):
+        return self._columns[field]
+
+    def set_column(self, field, values):
+        """
+        Set (or replace) the column of a field, values may be a single value
+        that will be used for all the value points
+        """
+        if not isinstance(values, numpy.ndarray):
+            if isinstance(values, types.ListType):
+                values = to_array(values)
+            else:
+                values = to_array([values] * self._length)
+        if len(values) != self._length:
+            raise Exception('Column ' + field + ' has an unexpected length')
+        if field not in self._columns:
+            self._fields.append(field)
+        self._columns[field] = values
+
+    def project(self, fields):
+        """
+        Return a new batch only having the given fields (those the batch does
+        not have are ignored)
+        """
+        fields = [field for field in self._fields if field in fields]
+        columns = {field: self._columns[field] for field in fields}
+        return ValuePointBatch(columns, fields, self._length)
+
+    def select(self, selection):
+        """
+        Return a new batch with the value points selected by a boolean mask or
+        an array of indexes
+        """
+        selection = numpy.asarray(selection)
+        columns = {field: column[selection]
+                   for (field, column) in self._columns.items()}
+        if selection.dtype == bool:
+            length = int(numpy.count_nonzero(selection))
+        else:
+            length = len(selection)
+        return ValuePointBatch(columns, self._fields[:], length)
+
+    def to_value_points(self):
+        """
+        Convert the batch to a list of value points (dictionaries)
+        """
+        columns_values = [(field, self._columns[field].tolist())
+                          for field in self._fields]
+        value_points = []
+        for index in xrange(self._length):
+            value_point = {}
+            for (field, values) in columns_values:
+                value = values[index]
+                if value is not None:
+                    value_point[field] = value
+            value_points.append(value_point)
+        return value_points
+
+
+def to_array(values):
+    """
+    Convert a list to the most relevant numpy array: numeric values get a
+    numeric array, anything else is kept in an object array
+    """
+    numeric_types = (types.IntType, types.LongType, types.FloatType)
+    if all(type(value) in numeric_types for value in values):
+        if all(type(value) is not types.FloatType for value in values):
+            try:
+                return numpy.array(values, dtype=numpy.int64)
+            except OverflowError:
+                pass
+        return numpy.array(values, dtype=float)
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
@@ -1,6 +1,19 @@
 import os
 import csv
+import mmap
 import types
+import multiprocessing
+import numpy
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+from artemisia.batch import ValuePointBatch
+from artemisia.dataloader.cache import ParsedDataCache
+from artemisia.dataloader.column_store import ColumnStore
+from artemisia.dataloader.file_index import FileIndex
+from artemisia.dataloader.schema import Schema, number_re
 
 
 class DataLoader:
@@ -8,8 +21,15 @@ class DataLoader:
     This class is meant to load CSV data from a directory and returning a stream
     (one `yield` per file) of stream (one yield per line) of dictionnaries
     (keys are CSV headers)
+
+    In batch mode, each file is yielded as a single ValuePointBatch.
+
+    The data files may also be column stores (see ColumnStore), read through
+    memory maps.
     """
     _casts = {}
+    _discovery = {}
+    _file_indexes = {}
 
     @staticmethod
     def add_cast(field, what):
@@ -21,19 +41,170 @@ class DataLoader:
             DataLoader._casts[what] = []
         DataLoader._casts[what].append(field)
 
+    @staticmethod
+    def set_discovery(recursive=False, include_patterns=None,
+                      exclude_patterns=None, file_index_path=None):
+        """
+        Configure how list_data_files() finds the data files (see FileIndex),
+        for every DataLoader since the ones of the modifiers (such as the
+        Normalizer) have to find the same files
+        """
+        DataLoader._discovery = {'recursive': recursive,
+                                 'include_patterns': include_patterns,
+                                 'exclude_patterns': exclude_patterns,
+                                 'index_path': file_index_path}
+        DataLoader._file_indexes = {}
+
     def __init__(self):
         self._data_file_extension = "csv"
         self._optimist_cast = True
+        self._workers_count = 1
+        self._preserve_order = True
+        self._parallel_chunk_size = 16
+        self._batch_mode = False
+        self._cache = None
+        self._filter_manager = None
+        self._filter_fields = []
+        self._filter_file_data = False
+        self._first_to_match_filters = None
+        self._split_min_size = 64 * 1024 * 1024
+        self._column_store_chunk_size = 65536
+        self._projection = None
+        self._schema = None
+        self._inferred_schema = Schema()
+        self._schema_sample_files_count = 3
+        self._schema_sample_rows_count = 100
+        self._sampled_files_count = 0
+        self._parser = 'python'
+
+    def set_workers_count(self, workers_count):
+        """
+        Set the number of processes used to parse the files of a directory, 1
+        (the default) parses them in the current process
+        """
+        self._workers_count = max(1, int(workers_count))
+
+    def set_preserve_order(self, preserve_order):
+        """
+        When parsing in parallel, tell whether the files must be yielded in the
+        order of list_data_files() or as soon as they are parsed
+        """
+        self._preserve_order = preserve_order
+
+    def set_batch_mode(self, batch_mode):
+        """
+        In batch mode the data of a file is yielded as a ValuePointBatch rather
+        than as a stream of dictionaries
+        """
+        self._batch_mode = batch_mode
+
+    def set_parser(self, parser):
+        """
+        'python' (the default) parses the files with the csv module, 'pandas'
+        reads whole files into typed columns with the C parser of pandas
+        (falling back to 'python' when pandas is not available). With pandas,
+        the fields missing at the end of a line get empty values.
+        """
+        if parser not in ['python', 'pandas']:
+            raise Exception('Unexpected parser ' + str(parser))
+        if (parser == 'pandas') & (pandas is None):
+            print 'pandas is not available, the python parser is used'
+            parser = 'python'
+        self._parser = parser
+
+    def set_cache_dir_path(self, cache_dir_path):
+        """
+        Keep the parsed data files in this directory, so that only new or
+        changed files are parsed again. None disables the cache.
+        """
+        if cache_dir_path is None:
+            self._cache = None
+            return
+        self._cache = ParsedDataCache(cache_dir_path)
+
+    def get_cache(self):
+        return self._cache
+
+    def set_filter_manager(self, filter_manager, filter_file_data=False):
+        """
+        Filter the data while loading it, before the modifiers run: value
+        points not matching the file data filters of the FilterManager are
+        dropped, or with filter_file_data, the files whose last value point
+        does not match them. None disables it.
+        """
+        self._filter_manager = filter_manager
+        self._filter_file_data = filter_file_data \
+            and (filter_manager is not None)
+        self._filter_fields = []
+        if filter_manager is None:
+            return
+        for field in filter_manager.get_target_fields():
+            field = field.strip('|')
+            if field not in self._filter_fields:
+                self._filter_fields.append(field)
+
+    def set_projection(self, fields):
+        """
+        Only load these fields (along with the ones of the filters), the
+        other columns of the data files are neither parsed nor casted. None
+        loads every field.
+        """
+        if fields is None:
+            self._projection = None
+            return
+        self._projection = set(field.strip('|') for field in fields)
+
+    def set_schema(self, schema):
+        """
+        Pin the Schema of the data files, None (the default) infers it from
+        the first rows of the first files
+        """
+        self._schema = schema
+
+    def get_schema(self):
+        if self._schema is not None:
+            return self._schema
+        return self._inferred_schema
+
+    def infer_schema(self, dir_path):
+        """
+        Return the Schema inferred from the first rows of the first files of a
+        directory
+        """
+        schema = Schema()
+        for (index, file_path) in enumerate(self.list_data_files(dir_path)):
+            if index >= self._schema_sample_files_count:
+                break
+            schema.update_from_file(file_path, self._schema_sample_rows_count)
+        return schema
+
+    def set_first_to_match_filters(self, first_to_match_filters):
+        """
+        Only load, from each file, the value points a FilterManager with these
+        first to match filters may pick: the first one matching them (the file
+        is read up to it) and the last one (read from the end of the file).
+        None loads every value point.
+        """
+        self._first_to_match_filters = first_to_match_filters
 
     def extract_from_path(self, path):
         """
         Extract from the path (picking the right method to call)
         """
-        if os.path.isdir(path):
+        if os.path.isdir(path) and not ColumnStore.is_store(path):
             for file_data in self.extract_from_dir(path):
                 yield file_data
+            return
+        if self._should_split_file(path):
+            file_data = self._extract_file_in_parallel(path)
         else:
-            for value_point in self.extract_from_file(path):
+            file_data = self._get_file_data(path)
+        if file_data is None:
+            return
+        if self._batch_mode:
+            yield file_data
+        else:
+            for value_point in file_data:
                 yield value_point
 
 
@@ -41,48 +212,614 @@ class DataLoader:
         """
         Extract the data from a directory
         """
-        for file_path in self.list_data_files(dir_path):
-            file_data = self.extract_from_file(file_path)
-            yield file_data
+        if self._workers_count > 1:
+            file_data_generator = self._extract_from_dir_in_parallel(dir_path)
+        else:
+            file_data_generator = (self._get_file_data(file_path)
+                                   for file_path
+                                   in self.list_data_files(dir_path))
+        for file_data in file_data_generator:
+            if file_data is not None:
+                yield file_data
+
+    def extract_file_data(self, file_path):
+        """
+        Extract the data from a file_path as a list, None if the file is
+        filtered out (this is what is sent back by the worker processes)
+        """
+        file_data = self._get_file_data(file_path)
+        if isinstance(file_data, types.GeneratorType):
+            file_data = [value_point for value_point in file_data]
+        return file_data
+
+    def _get_file_data(self, file_path):
+        """
+        The data of a file as expected by extract_from_dir(), None if the file
+        is filtered out
+        """
+        if self._batch_mode:
+            file_data = self.extract_batch_from_file(file_path)
+        elif self._filter_file_data:
+            file_data = [value_point for value_point
+                         in self.extract_from_file(file_path)]
+        else:
+            return self.extract_from_file(file_path)
+        if self._filter_manager is None:
+            return file_data
+        if len(file_data) == 0:
+            return None
+        if self._filter_file_data \
+                and not self._filter_manager.matches(file_data):
+            return None
+        return file_data
 
     def extract_from_file(self, file_path):
         """
         Extract the data from a file_path
         """
-        reader = csv.reader(open(file_path))
+        if ColumnStore.is_store(file_path):
+            for value_point in self._extract_batch_from_store(file_path):
+                yield value_point
+            return
+        if self._first_to_match_filters is not None:
+            for value_point in self._extract_selection_from_file(file_path):
+                yield value_point
+            return
+        if (self._cache is not None) | (self._parser == 'pandas'):
+            for value_point in self.extract_batch_from_file(file_path):
+                yield value_point
+            return
+        with open(file_path) as f:
+            for value_point in self._extract_from_lines(file_path, f):
+                yield value_point
+
+    def _extract_from_lines(self, file_path, lines):
+        """
+        Extract the data from the lines of a file, the first being its header
+        """
         header = None
-        for row in reader:
+        filter_rows = self._filters_rows()
+        for row in csv.reader(lines):
             if header is None:
                 header = row
+                projected_header = self._get_projected_header(header)
+                projected_fields = [field for (index, field)
+                                    in projected_header]
+                schema = self._get_schema(file_path)
+                cast_plan = self._get_cast_plan(schema, projected_fields)
+                filter_cast_plan = self._get_cast_plan(
+                    schema, [field for field in projected_fields
+                             if field in self._filter_fields])
+                other_cast_plan = self._get_cast_plan(
+                    schema, [field for field in projected_fields
+                             if field not in self._filter_fields])
                 continue
-            value_point = dict(zip(header, row))
-            self._clean_data_value(value_point)
+            if self._projection is None:
+                value_point = dict(zip(header, row))
+            else:
+                value_point = {field: row[index]
+                               for (index, field) in projected_header
+                               if index < len(row)}
             if len(value_point.viewkeys()) == 0:
                 continue
+            if not filter_rows:
+                self._apply_cast_plan(value_point, cast_plan)
+                value_point['_file_path'] = file_path
+                yield value_point
+                continue
+            # only the filtered fields are casted before filtering
             value_point['_file_path'] = file_path
+            self._apply_cast_plan(value_point, filter_cast_plan)
+            if not self._filter_manager.matches(value_point):
+                continue
+            self._apply_cast_plan(value_point, other_cast_plan)
             yield value_point
 
+    def extract_batch_from_file(self, file_path):
+        """
+        Extract the data from a file_path as a ValuePointBatch, casts are done
+        column by column
+        """
+        if ColumnStore.is_store(file_path):
+            return self._extract_batch_from_store(file_path)
+        if (self._cache is None) & (self._first_to_match_filters is not None):
+            return ValuePointBatch.from_value_points(
+                self._extract_selection_from_file(file_path))
+        if self._cache is None:
+            return self._parse_batch_from_file(file_path)
+        casts_signature = self._get_casts_signature()
+        batch = self._cache.get(file_path, casts_signature)
+        if batch is None:
+            # the whole file is cached, whatever the filters and projection are
+            batch = self._parse_batch_from_file(file_path, True)
+            self._cache.store(file_path, casts_signature, batch)
+        else:
+            batch.set_column('_file_path', file_path)
+        if self._filters_rows():
+            batch = batch.select(self._filter_manager.get_batch_mask(batch))
+        if self._projection is not None:
+            batch = batch.project([field for field in batch.get_fields()
+                                   if self._is_projected(field)
+                                   or (field == '_file_path')])
+        return batch
+
+    def get_byte_ranges(self, file_path, ranges_count):
+        """
+        Split the lines of a data file (but its header) into at most
+        ranges_count (start, end) byte ranges ending with line breaks
+        """
+        if os.path.getsize(file_path) == 0:
+            return []
+        with open(file_path, 'rb') as f:
+            mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = len(mapped_file)
+            start = mapped_file.find('\n') + 1
+            if start == 0:
+                return []  # the only line is the header
+            range_size = -(-(size - start) // ranges_count)
+            byte_ranges = []
+            while start < size:
+                end = mapped_file.find('\n', start + range_size - 1) + 1
+                if end == 0:
+                    end = size
+                byte_ranges.append((start, end))
+                start = end
+            return byte_ranges
+        finally:
+            mapped_file.close()
+
+    def extract_byte_range(self, file_path, start, end):
+        """
+        Extract the data of the lines of a file within a byte range (see
+        get_byte_ranges()) as a list of value points, or as a ValuePointBatch
+        in batch mode
+        """
+        with open(file_path, 'rb') as f:
+            mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_line = mapped_file[:mapped_file.find('\n') + 1]
+            lines = [header_line] + mapped_file[start:end].splitlines(True)
+        finally:
+            mapped_file.close()
+        if self._batch_mode:
+            return self._parse_batch_from_lines(file_path, lines)
+        return [value_point for value_point
+                in self._extract_from_lines(file_path, lines)]
+
+    def _should_split_file(self, file_path):
+        """
+        Tell whether a single large data file is parsed in parallel, by byte
+        ranges (whole files are needed to cache them or to select value points)
+        """
+        return (self._workers_count > 1) \
+            and (not ColumnStore.is_store(file_path)) \
+            and (self._cache is None) \
+            and (self._first_to_match_filters is None) \
+            and (not self._filter_file_data) \
+            and (os.path.getsize(file_path) >= self._split_min_size)
+
+    def _extract_file_in_parallel(self, file_path):
+        byte_ranges = [(file_path, start, end) for (start, end)
+                       in self.get_byte_ranges(file_path,
+                                               self._workers_count * 4)]
+        ranges_data = self._map_in_parallel(_extract_worker_byte_range,
+                                            byte_ranges, True, 1)
+        if self._batch_mode:
+            return ValuePointBatch.concatenate([range_data for range_data
+                                                in ranges_data])
+        return (value_point for range_data in ranges_data
+                for value_point in range_data)
+
+    def _extract_batch_from_store(self, file_path):
+        store = ColumnStore(file_path)
+        fields = [field for field in store.get_fields()
+                  if self._is_projected(field)]
+        if self._first_to_match_filters is not None:
+            return ValuePointBatch.from_value_points(
+                self._extract_selection_from_store(store, fields, file_path))
+        batch = store.get_batch(fields)
+        batch.set_column('_file_path', file_path)
+        if self._filters_rows():
+            batch = batch.select(self._filter_manager.get_batch_mask(batch))
+        return batch
+
+    def _extract_selection_from_store(self, store, fields, file_path):
+        """
+        Same as _extract_selection_from_file(), the filtered fields are read
+        by chunks until a value point matches
+        """
+        if len(store) == 0:
+            return []
+        last_value_point = store.get_value_point(-1, fields)
+        last_value_point['_file_path'] = file_path
+        if self._filter_file_data and \
+                not self._filter_manager.matches(last_value_point):
+            return [last_value_point]  # the whole file is filtered out
+        if self._first_to_match_filters[0] == 'last':
+            return [last_value_point]
+        first_index = None
+        if 'last' in self._first_to_match_filters:
+            # only the first value point is checked before 'last'
+            first_index = 0
+        filter_fields = set(field.strip('|')
+                            for field_filter in self._first_to_match_filters
+                            if field_filter != 'last'
+                            for field in field_filter.get_target_fields())
+        start = 0
+        while (first_index is None) and (start < len(store)):
+            chunk = store.get_batch(filter_fields, start,
+                                    start + self._column_store_chunk_size)
+            mask = numpy.zeros(len(chunk), dtype=bool)
+            for field_filter in self._first_to_match_filters:
+                mask |= field_filter.match_batch(chunk)
+            matching_indexes = numpy.flatnonzero(mask)
+            if len(matching_indexes) != 0:
+                first_index = start + int(matching_indexes[0])
+            start += self._column_store_chunk_size
+        if first_index is None:
+            return [last_value_point]
+        value_point = store.get_value_point(first_index, fields)
+        value_point['_file_path'] = file_path
+        return [value_point, last_value_point]
+
+    def _extract_selection_from_file(self, file_path):
+        """
+        Return the first value point matching the first to match filters, if
+        any, followed by the last value point of the file
+        """
+        with open(file_path, 'rb') as f:
+            header = next(csv.reader(f), None)
+        last_row = self._read_last_row(file_path)
+        if (header is None) or (last_row is None):
+            return []
+        projected_header = self._get_projected_header(header)
+        cast_plan = self._get_cast_plan(
+            self._get_schema(file_path),
+            [field for (index, field) in projected_header])
+        last_value_point = self._get_value_point(projected_header, last_row,
+                                                 file_path, cast_plan)
+        if self._filter_file_data and \
+                not self._filter_manager.matches(last_value_point):
+            return [last_value_point]  # the whole file is filtered out
+        if self._first_to_match_filters[0] == 'last':
+            return [last_value_point]
+        with open(file_path, 'rb') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                if len(row) == 0:
+                    continue
+                value_point = self._get_value_point(projected_header, row,
+                                                    file_path, cast_plan)
+                for field_filter in self._first_to_match_filters:
+                    if field_filter == 'last':
+                        # only the first value point is checked before 'last'
+                        return [value_point, last_value_point]
+                    if field_filter.match(value_point):
+                        return [value_point, last_value_point]
+        return [last_value_point]
+
+    def _get_value_point(self, projected_header, row, file_path, cast_plan):
+        value_point = {field: row[index] for (index, field) in projected_header
+                       if index < len(row)}
+        self._apply_cast_plan(value_point, cast_plan)
+        value_point['_file_path'] = file_path
+        return value_point
+
+    def _get_projected_header(self, header):
+        """
+        Return the (index, field) tuples of the header fields to load
+        """
+        return [(index, field) for (index, field) in enumerate(header)
+                if self._is_projected(field)]
+
+    def _is_projected(self, field):
+        return (self._projection is None) or (field in self._projection) \
+            or (field in self._filter_fields)
+
+    def _read_last_row(self, file_path):
+        """
+        Parse the last non empty line of a file, which is searched backwards
+        in a memory map of the file (only its last pages are read). None if
+        the file only has a header.
+        """
+        if os.path.getsize(file_path) == 0:
+            return None
+        with open(file_path, 'rb') as f:
+            mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = len(mapped_file)
+            while (end > 0) and (mapped_file[end - 1] in '\r\n'):
+                end -= 1
+            line_start = max(mapped_file.rfind('\n', 0, end),
+                             mapped_file.rfind('\r', 0, end))
+            if line_start == -1:
+                # the only line is the header
+                return None
+            return next(csv.reader([mapped_file[line_start + 1:end]]))
+        finally:
+            mapped_file.close()
+
+    def _parse_batch_from_file(self, file_path, whole_file=False):
+        if self._parser == 'pandas':
+            batch = self._parse_batch_with_pandas(file_path, whole_file)
+            if batch is not None:
+                return batch
+        with open(file_path) as f:
+            return self._parse_batch_from_lines(file_path, f, whole_file)
+
+    def _parse_batch_from_lines(self, file_path, lines, whole_file=False):
+        """
+        Parse the lines of a file, the first being its header, as a
+        ValuePointBatch
+        """
+        header = None
+        rows = []
+        for row in csv.reader(lines):
+            if header is None:
+                header = row
+                continue
+            if len(row) == 0:
+                continue
+            rows.append(row)
+        fields = []
+        indexes = {}
+        for (index, field) in enumerate(header or []):
+            if not (whole_file or self._is_projected(field)):
+                continue
+            if field not in indexes:
+                fields.append(field)
+            indexes[field] = index
+        schema = self._get_schema(file_path)
+        file_path_column = numpy.empty(len(rows), dtype=object)
+        file_path_column[:] = file_path
+        columns = {'_file_path': file_path_column}
+        fields.append('_file_path')
+        if (not whole_file) and self._filters_rows():
+            # only the filtered fields are casted before filtering
+            filter_fields = [field for field in fields
+                             if field in self._filter_fields]
+            for field in filter_fields:
+                columns[field] = self._get_data_column(field, indexes[field],
+                                                       rows, schema)
+            mask = self._filter_manager.get_batch_mask(
+                ValuePointBatch(columns, filter_fields + ['_file_path'],
+                                len(rows)))
+            rows = [row for (row, match) in zip(rows, mask.tolist())
+                    if match]
+            columns = {field: column[mask]
+                       for (field, column) in columns.items()}
+        for field in fields:
+            if field not in columns:
+                columns[field] = self._get_data_column(field, indexes[field],
+                                                       rows, schema)
+        return ValuePointBatch(columns, fields, len(rows))
+
+    def _parse_batch_with_pandas(self, file_path, whole_file):
+        """
+        Same as _parse_batch_from_file() with pandas.read_csv(), None when the
+        file has to be parsed by the python parser
+        """
+        with open(file_path, 'rb') as f:
+            header = next(csv.reader(f), None)
+        if (header is None) or (len(set(header)) != len(header)):
+            return None  # read_csv renames duplicated fields
+        fields = [field for field in header
+                  if whole_file or self._is_projected(field)]
+        if len(fields) == 0:
+            return None
+        casted_fields = set(field for cast_fields in DataLoader._casts.values()
+                            for field in cast_fields)
+        if not self._optimist_cast:
+            casted_fields = set(fields)
+        # explicitly casted fields are read as strings, like with the python
+        # parser, numbers are parsed like float() does
+        read_csv_args = {'usecols': fields, 'keep_default_na': False,
+                         'float_precision': 'round_trip'}
+        try:
+            frame = pandas.read_csv(
+                file_path, dtype={field: str for field in fields
+                                  if field in casted_fields},
+                **read_csv_args)
+            boolean_fields = [field for field in fields
+                              if frame[field].dtype == bool]
+            if len(boolean_fields) != 0:
+                # the python parser keeps them as strings
+                read_csv_args['usecols'] = boolean_fields
+                boolean_frame = pandas.read_csv(file_path, dtype=str,
+                                                **read_csv_args)
+                for field in boolean_fields:
+                    frame[field] = boolean_frame[field]
+        except ValueError:
+            return None  # malformed lines
+        schema = self._get_schema(file_path)
+        columns = {}
+        for field in fields:
+            column = frame[field].values
+            if column.dtype.kind in 'iu':
+                column = column.astype(float)
+            columns[field] = self._clean_data_column(field, column, schema)
+        file_path_column = numpy.empty(len(frame), dtype=object)
+        file_path_column[:] = file_path
+        columns['_file_path'] = file_path_column
+        batch = ValuePointBatch(columns, fields + ['_file_path'], len(frame))
+        if (not whole_file) and self._filters_rows():
+            batch = batch.select(self._filter_manager.get_batch_mask(batch))
+        return batch
+
+    def _get_data_column(self, field, index, rows, schema):
+        values = [row[index] if index < len(row) else None for row in rows]
+        column = numpy.empty(len(rows), dtype=object)
+        column[:] = values
+        return self._clean_data_column(field, column, schema)
+
+    def _filters_rows(self):
+        return (self._filter_manager is not None) \
+            and not self._filter_file_data
+
+    def _extract_from_dir_in_parallel(self, dir_path):
+        return self._map_in_parallel(_extract_worker_file_data,
+                                     self.list_data_files(dir_path),
+                                     self._preserve_order,
+                                     self._parallel_chunk_size)
+
+    def _map_in_parallel(self, worker_function, arguments, preserve_order,
+                         chunk_size):
+        pool = multiprocessing.Pool(self._workers_count,
+                                    initializer=_init_worker,
+                                    initargs=(self, DataLoader._casts))
+        try:
+            if preserve_order:
+                pool_map = pool.imap
+            else:
+                pool_map = pool.imap_unordered
+            for result in pool_map(worker_function, arguments, chunk_size):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
     def list_data_files(self, dir_path):
-        for fileName in os.listdir(dir_path):
-            if fileName.endswith("." + self._data_file_extension):
-                yield os.path.join(dir_path, fileName)
+        return [file_path for (file_path, signature)
+                in self.get_file_index(dir_path).refresh()]
 
-    def _clean_data_value(self, value_point):
-        for wishedType, fields in DataLoader._casts.items():
+    def get_file_index(self, dir_path):
+        """
+        Return the FileIndex of a directory, shared by the DataLoaders
+        """
+        key = os.path.abspath(dir_path)
+        if key not in DataLoader._file_indexes:
+            discovery = dict(DataLoader._discovery)
+            if discovery.get('include_patterns', None) is None:
+                discovery['include_patterns'] = \
+                    ['*.' + self._data_file_extension,
+                     '*' + ColumnStore.extension]
+            DataLoader._file_indexes[key] = FileIndex(dir_path, **discovery)
+        return DataLoader._file_indexes[key]
+
+    def _clean_data_value(self, value_point, fields=None):
+        """
+        Cast the values of the value point, only the ones of the given fields
+        if any
+        """
+        if fields is None:
+            fields = value_point.keys()
+        self._apply_cast_plan(value_point,
+                              self._get_cast_plan(self.get_schema(), fields))
+
+    def _get_schema(self, file_path):
+        """
+        The schema to use for a file, the first files are sampled to infer it
+        """
+        if self._schema is not None:
+            return self._schema
+        if self._sampled_files_count < self._schema_sample_files_count:
+            self._inferred_schema.update_from_file(
+                file_path, self._schema_sample_rows_count)
+            self._sampled_files_count += 1
+        return self._inferred_schema
+
+    def _get_cast_plan(self, schema, fields):
+        """
+        Compile how the values of the fields are casted: the explicit casts
+        (field, type) first, then the optimist cast of the fields the schema
+        tells to be numbers, and of the remaining ones, which are only casted
+        when they look like numbers
+        """
+        explicit_casts = []
+        float_fields = []
+        guarded_fields = []
+        numeric_casted_fields = set()
+        for (wished_type, cast_fields) in DataLoader._casts.items():
+            for field in cast_fields:
+                if field in fields:
+                    explicit_casts.append((field, wished_type))
+                    if wished_type in ['int', 'float', 'percentage']:
+                        numeric_casted_fields.add(field)
+        if self._optimist_cast:
             for field in fields:
-                if field in value_point.keys():
-                    casted = self._cast(wishedType, value_point[field])
-                    value_point[field] = casted
-        if not self._optimist_cast:
-            return
-        for field in value_point.keys():
-            value = value_point[field]
-            if isinstance(value, types.StringType):
-                try:
-                    casted = self._cast('float', value)
-                    value_point[field] = casted
-                except ValueError:
-                    pass
+                if field in numeric_casted_fields:
+                    continue
+                if schema.get_type(field) == 'float':
+                    float_fields.append(field)
+                else:
+                    guarded_fields.append(field)
+        return (explicit_casts, float_fields, guarded_fields)
+
+    def _apply_cast_plan(self, value_point, cast_plan):
+        (explicit_casts, float_fields, guarded_fields) = cast_plan
+        for (field, wished_type) in explicit_casts:
+            if field in value_point:
+                value_point[field] = self._cast(wished_type, value_point[field])
+        try:
+            for field in float_fields:
+                if field in value_point:
+                    value_point[field] = float(value_point[field])
+        except ValueError:
+            # this value point does not follow the schema, the fields not
+            # casted yet are casted like the others
+            guarded_fields = guarded_fields + float_fields
+        for field in guarded_fields:
+            value = value_point.get(field, None)
+            if isinstance(value, types.StringType) \
+                    and (number_re.match(value) is not None):
+                value_point[field] = float(value)
+
+    def _get_casts_signature(self):
+        """
+        Return what the parsed values of a file depend on: the casts, the
+        parser (which does not fill short lines the same way) and the pinned
+        schema
+        """
+        casts = sorted((wished_type, sorted(fields))
+                       for (wished_type, fields) in DataLoader._casts.items())
+        schema_types = None
+        if self._schema is not None:
+            schema_types = sorted(self._schema.get_types().items())
+        return repr((casts, self._optimist_cast, self._parser, schema_types))
+
+    def _clean_data_column(self, field, column, schema=None):
+        for wishedType, fields in DataLoader._casts.items():
+            if field in fields:
+                column = self._cast_column(wishedType, column)
+        if (not self._optimist_cast) | (column.dtype != object):
+            return column
+        if (schema or self.get_schema()).get_type(field) == 'str':
+            return self._optimist_cast_cells(column)
+        if any(not isinstance(value, types.StringType) for value in column):
+            return self._optimist_cast_cells(column)
+        try:
+            return column.astype(float)
+        except ValueError:
+            return self._optimist_cast_cells(column)
+
+    def _optimist_cast_cells(self, column):
+        casted_column = numpy.empty(len(column), dtype=object)
+        casted_column[:] = [float(value)
+                            if isinstance(value, types.StringType)
+                            and (number_re.match(value) is not None)
+                            else value
+                            for value in column.tolist()]
+        return casted_column
+
+    def _cast_column(self, wishedType, column):
+        if wishedType not in ['int', 'float', 'percentage']:
+            return column
+        if any(value is None for value in column):
+            casted_column = numpy.empty(len(column), dtype=object)
+            casted_column[:] = [None if value is None
+                                else self._cast(wishedType, value)
+                                for value in column]
+            return casted_column
+        if wishedType == 'int':
+            return numpy.array([int(value) for value in column],
+                               dtype=numpy.int64)
+        column = column.astype(float)
+        if wishedType == 'percentage':
+            column *= 100.0
+        return column
 
     def _cast(self, wishedType, value):
         if wishedType == 'int':
@@ -92,4 +829,25 @@ class DataLoader:
         if wishedType == 'percentage':
             value = self._cast('float', value)
             return value * 100.0
-        return value
\ No newline at end of file
+        return value
+
+
+_worker_data_loader = None
+
+
+def _init_worker(data_loader, casts):
+    """
+    Called once in every worker process, the casts are sent along since they
+    are usually registered by the loader package at runtime
+    """
+    global _worker_data_loader
+    DataLoader._casts = casts
+    _worker_data_loader = data_loader
+
+
+def _extract_worker_file_data(file_path):
+    return _worker_data_loader.extract_file_data(file_path)
+
+
+def _extract_worker_byte_range(byte_range):
+    return _worker_data_loader.extract_byte_range(*byte_range)
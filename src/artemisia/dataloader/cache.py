@@ -0,0 +1,96 @@
+import os
+import hashlib
+import tempfile
+import numpy
+
+from artemisia.batch import ValuePointBatch
+
+
+class ParsedDataCache:
+    """
+    This class stores the parsed (and casted) content of the data files on the
+    disk, one .npz file per data file.
+
+    An entry is keyed by the path, the modification time and the size of the
+    data file, and by the casts configuration: a data file that changed is
+    parsed again, older entries are only removed by clear().
+    """
+
+    def __init__(self, cache_dir_path):
+        self._cache_dir_path = cache_dir_path
+        self._entry_extension = '.npz'
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, file_path, casts_signature):
+        """
+        Return the cached ValuePointBatch of a data file (without the
+        '_file_path' column) or None
+        """
+        entry_path = self._get_entry_path(file_path, casts_signature)
+        if not os.path.exists(entry_path):
+            self._misses += 1
+            return None
+        entry = numpy.load(entry_path, allow_pickle=True)
+        try:
+            fields = entry['fields'].tolist()
+            length = int(entry['length'])
+            columns = {field: entry['column_%d' % index]
+                       for (index, field) in enumerate(fields)}
+        finally:
+            entry.close()
+        self._hits += 1
+        return ValuePointBatch(columns, fields, length)
+
+    def store(self, file_path, casts_signature, batch):
+        if not os.path.isdir(self._cache_dir_path):
+            os.makedirs(self._cache_dir_path)
+        fields = [field for field in batch.get_fields()
+                  if field != '_file_path']
+        arrays = {'column_%d' % index: batch.get_column(field)
+                  for (index, field) in enumerate(fields)}
+        arrays['fields'] = numpy.array(fields, dtype=object)
+        arrays['length'] = numpy.array(len(batch))
+        # written aside and renamed, readers never see a partial entry
+        (handle, tmp_path) = tempfile.mkstemp(suffix=self._entry_extension,
+                                              dir=self._cache_dir_path)
+        with os.fdopen(handle, 'wb') as f:
+            numpy.savez(f, **arrays)
+        os.rename(tmp_path, self._get_entry_path(file_path, casts_signature))
+
+    def get_statistics(self):
+        """
+        Return the number of entries and their size in bytes, along with the
+        hits and misses of this instance
+        """
+        entries = self._list_entries()
+        size = sum(os.path.getsize(entry) for entry in entries)
+        return {'entries': len(entries), 'size': size,
+                'hits': self._hits, 'misses': self._misses}
+
+    def clear(self):
+        """
+        Remove every entry, return the number of removed entries
+        """
+        entries = self._list_entries()
+        for entry in entries:
+            os.remove(entry)
+        return len(entries)
+
+    def _list_entries(self):
+        if not os.path.isdir(self._cache_dir_path):
+            return []
+        return [os.path.join(self._cache_dir_path, file_name)
+                for file_name in os.listdir(self._cache_dir_path)
+                if file_name.endswith(self._entry_extension)
+                and not file_name.startswith('tmp')]
+
+    def _get_entry_path(self, file_path, casts_signature):
+        stat = os.stat(file_path)
+        hash_input = '|'.join([os.path.abspath(file_path),
+                               repr(stat.st_mtime), str(stat.st_size),
+                               casts_signature])
+        md5 = hashlib.md5()
+        md5.update(hash_input)
+        return os.path.join(self._cache_dir_path,
+                            md5.hexdigest() + self._entry_extension)
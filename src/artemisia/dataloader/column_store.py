@@ -0,0 +1,116 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy
+
+from artemisia.batch import ValuePointBatch
+
+
+class ColumnStore:
+    """
+    This class reads a data file converted to a binary columnar format: a
+    directory (with a .columns extension) holding one .npy file per field and
+    a fields.json file describing them.
+
+    The numbers and strings columns are memory-mapped (numpy.memmap), reading
+    a value point or a slice of a column only touches the pages it needs. The
+    columns mixing types (or missing values) are pickled and loaded entirely.
+    """
+    extension = '.columns'
+
+    def __init__(self, store_path):
+        self._store_path = store_path
+        with open(os.path.join(store_path, 'fields.json')) as f:
+            description = json.load(f)
+        self._fields = [str(field) for field in description['fields']]
+        self._mapped = dict(zip(self._fields, description['mapped']))
+        self._length = description['length']
+        self._columns = {}
+
+    @staticmethod
+    def is_store(path):
+        return path.endswith(ColumnStore.extension) and os.path.isdir(path)
+
+    @staticmethod
+    def write(store_path, batch):
+        """
+        Write the columns of a ValuePointBatch (but '_file_path') as a column
+        store, an existing store is replaced
+        """
+        parent_dir_path = os.path.dirname(os.path.abspath(store_path))
+        # written aside and renamed, readers never see a partial store
+        tmp_path = tempfile.mkdtemp(dir=parent_dir_path, prefix='tmp')
+        fields = [field for field in batch.get_fields()
+                  if field != '_file_path']
+        mapped = []
+        for (index, field) in enumerate(fields):
+            column = _get_storable_column(batch.get_column(field))
+            mapped.append(column.dtype != object)
+            numpy.save(os.path.join(tmp_path, 'column_%d.npy' % index),
+                       column, allow_pickle=True)
+        with open(os.path.join(tmp_path, 'fields.json'), 'w') as f:
+            json.dump({'fields': fields, 'mapped': mapped,
+                       'length': len(batch)}, f)
+        if os.path.isdir(store_path):
+            shutil.rmtree(store_path)
+        os.rename(tmp_path, store_path)
+
+    def __len__(self):
+        return self._length
+
+    def get_fields(self):
+        return self._fields[:]
+
+    def get_column(self, field, start=0, end=None):
+        """
+        Return the values of a field from start to end, numbers are returned
+        as a (copy on write) memory-mapped array
+        """
+        column = self._get_stored_column(field)[start:end]
+        if column.dtype.kind == 'S':
+            return column.astype(object)
+        return column
+
+    def get_batch(self, fields=None, start=0, end=None):
+        """
+        Return the value points from start to end as a ValuePointBatch, with
+        the given fields only (those the store does not have are ignored)
+        """
+        if fields is None:
+            fields = self._fields
+        fields = [field for field in self._fields if field in fields]
+        (start, end, step) = slice(start, end).indices(self._length)
+        columns = {field: self.get_column(field, start, end)
+                   for field in fields}
+        return ValuePointBatch(columns, fields, max(0, end - start))
+
+    def get_value_point(self, index, fields=None):
+        if index < 0:
+            index += self._length
+        return self.get_batch(fields, index, index + 1)[0]
+
+    def _get_stored_column(self, field):
+        if field not in self._columns:
+            column_path = os.path.join(
+                self._store_path,
+                'column_%d.npy' % self._fields.index(field))
+            mmap_mode = None
+            if self._mapped[field]:
+                mmap_mode = 'c'
+            self._columns[field] = numpy.load(column_path, mmap_mode=mmap_mode,
+                                              allow_pickle=True)
+        return self._columns[field]
+
+
+def _get_storable_column(column):
+    """
+    Strings columns are stored as fixed width strings, which can be
+    memory-mapped
+    """
+    if column.dtype != object:
+        return column
+    values = column.tolist()
+    if all(isinstance(value, str) for value in values):
+        return numpy.array(values, dtype=str)
+    return column
@@ -0,0 +1,118 @@
+import os
+import fnmatch
+import pickle
+import tempfile
+import time
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from artemisia.dataloader.column_store import ColumnStore
+
+
+class FileIndex:
+    """
+    This class lists the data files of a directory, recursively or not: the
+    files matching the include patterns and none of the exclude patterns
+    (fnmatch patterns matched against the path relative to the directory,
+    excluded subdirectories are not explored). Column stores are directories
+    but are listed as data files.
+
+    The listing of every directory is kept along with its modification time,
+    a refresh only lists again the directories where files were added, removed
+    or renamed, only the data files are stated. The listings can be persisted
+    in a file to be reused by the next runs.
+
+    As with git, a listing made within a few seconds of the modification of its
+    directory is not trusted (the file system may not have a finer time
+    resolution) and is made again.
+    """
+
+    def __init__(self, dir_path, include_patterns, exclude_patterns=None,
+                 recursive=False, index_path=None):
+        self._dir_path = dir_path
+        self._include_patterns = include_patterns
+        self._exclude_patterns = exclude_patterns or []
+        self._recursive = recursive
+        self._index_path = index_path
+        self._racy_delay = 2.0
+        self._directories = {}
+        if (index_path is not None) and os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                self._directories = pickle.load(f).get(self._get_key(), {})
+
+    def refresh(self):
+        """
+        Update the index, return the (file path, (modification time, size))
+        tuples of the data files, in the order they are listed
+        """
+        files = []
+        mtime = os.stat(self._dir_path).st_mtime
+        if self._refresh_directory('', mtime, files) \
+                and (self._index_path is not None):
+            self._persist()
+        return files
+
+    def _refresh_directory(self, relative_dir_path, mtime, files):
+        listing = self._directories.get(relative_dir_path, None)
+        updated = False
+        if (listing is None) or (listing[0] != mtime) \
+                or (listing[1] - mtime < self._racy_delay):
+            listing = (mtime, time.time(),
+                       self._list_directory(relative_dir_path))
+            self._directories[relative_dir_path] = listing
+            updated = True
+        for (name, is_dir) in listing[2]:
+            relative_path = name
+            if relative_dir_path != '':
+                relative_path = relative_dir_path + '/' + name
+            if self._matches(relative_path, self._exclude_patterns):
+                continue
+            path = os.path.join(self._dir_path, relative_path)
+            is_store = is_dir and name.endswith(ColumnStore.extension)
+            if is_dir and not is_store:
+                if self._recursive:
+                    updated |= self._refresh_directory(
+                        relative_path, os.stat(path).st_mtime, files)
+                continue
+            if not self._matches(relative_path, self._include_patterns):
+                continue
+            stat = os.stat(path)
+            files.append((path, (stat.st_mtime, stat.st_size)))
+        return updated
+
+    def _list_directory(self, relative_dir_path):
+        """
+        Return the (name, is directory) tuples of the entries of a directory
+        """
+        dir_path = os.path.join(self._dir_path, relative_dir_path)
+        if scandir is not None:
+            return [(entry.name, entry.is_dir()) for entry in scandir(dir_path)]
+        return [(name, os.path.isdir(os.path.join(dir_path, name)))
+                for name in os.listdir(dir_path)]
+
+    def _matches(self, relative_path, patterns):
+        for pattern in patterns:
+            if fnmatch.fnmatch(relative_path, pattern):
+                return True
+        return False
+
+    def _persist(self):
+        indexes = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, 'rb') as f:
+                indexes = pickle.load(f)
+        indexes[self._get_key()] = self._directories
+        # written aside and renamed, readers never see a partial index
+        (handle, tmp_path) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._index_path)))
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(indexes, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._index_path)
+
+    def _get_key(self):
+        return os.path.abspath(self._dir_path)
@@ -0,0 +1,74 @@
+import re
+import csv
+import json
+
+
+# the strings float() accepts
+number_re = re.compile(r'^\s*[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+                       r'|inf(?:inity)?|nan)\s*$', re.IGNORECASE)
+
+
+class Schema:
+    """
+    This class stores the type of the fields of the data files: 'float' when
+    every value seen was a number, 'str' otherwise.
+
+    It is inferred from samples of the data files, or pinned from a file
+    (see save() and load()). The schema only tells the DataLoader how to
+    cast the values efficiently, a value that does not match the type of its
+    field is still casted the optimist way.
+    """
+
+    def __init__(self, types=None):
+        self._types = dict(types or {})
+
+    @staticmethod
+    def load(file_path):
+        with open(file_path) as f:
+            return Schema(json.load(f)['types'])
+
+    def save(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump({'types': self._types}, f, indent=4, sort_keys=True)
+
+    def get_type(self, field):
+        """
+        Return 'float', 'str' or None for the fields never seen
+        """
+        return self._types.get(field, None)
+
+    def get_types(self):
+        return dict(self._types)
+
+    def update_from_file(self, file_path, rows_count):
+        """
+        Update the types from the first rows of a data file
+        """
+        header = None
+        columns = None
+        with open(file_path, 'rb') as f:
+            for row in csv.reader(f):
+                if header is None:
+                    header = row
+                    columns = [[] for field in header]
+                    continue
+                if len(row) == 0:
+                    continue
+                for (values, value) in zip(columns, row):
+                    values.append(value)
+                rows_count -= 1
+                if rows_count <= 0:
+                    break
+        for (field, values) in zip(header or [], columns or []):
+            self.update(field, values)
+
+    def update(self, field, values):
+        """
+        Update the type of a field from some of its (string) values
+        """
+        if (self._types.get(field, None) == 'str') | (len(values) == 0):
+            return
+        if all(number_re.match(value) is not None for value in values):
+            self._types[field] = 'float'
+        else:
+            self._types[field] = 'str'
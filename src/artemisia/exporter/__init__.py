@@ -1,5 +1,7 @@
 import artemisia.exporter.arff_exporter
 import artemisia.exporter.csv_exporter
+import artemisia.exporter.npz_exporter
+import artemisia.exporter.arrow_exporter
 
 
 class ExporterFactory:
@@ -9,6 +11,12 @@ class ExporterFactory:
             exporter = arff_exporter.ArffExporter()
         elif export_type == 'csv':
             exporter = csv_exporter.CsvExporter()
+        elif export_type == 'npz':
+            exporter = npz_exporter.NpzExporter()
+        elif export_type == 'feather':
+            exporter = arrow_exporter.FeatherExporter()
+        elif export_type == 'parquet':
+            exporter = arrow_exporter.ParquetExporter()
         else:
             raise Exception('Unexpected type ' + export_type)
         return exporter
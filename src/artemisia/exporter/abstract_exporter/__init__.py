@@ -7,6 +7,7 @@ class Exporter:
         self._file_path = None
         self._file_handle = None
         self._relation_name = 'artemisia_export'
+        self._binary = False
 
     def _export(self, file_data_generator):
         raise NotImplementedError("Please implement this method in a subclass")
@@ -30,7 +31,10 @@ class Exporter:
     def get_file_handle(self):
         if self._file_handle is None:
             if self._file_path is not None:
-                self._file_handle = open(self._file_path, 'w')
+                mode = 'w'
+                if self._binary:
+                    mode = 'wb'
+                self._file_handle = open(self._file_path, mode)
             else:
                 self._file_handle = StringIO()
         return self._file_handle
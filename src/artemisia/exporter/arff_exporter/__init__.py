@@ -1,8 +1,16 @@
 from artemisia.exporter.abstract_exporter import Exporter
-import itertools
+import cPickle
+import tempfile
 
 
 class ArffExporter(Exporter):
+    """
+    The types of the attributes are declared in the header, before the data:
+    the value points are written to a temporary file while the types are
+    guessed (from at most _arff_max_fetched_values distinct values per
+    column), and are then read back to write the data section. The memory
+    used does not depend on the number of value points.
+    """
 
     def __init__(self):
         Exporter.__init__(self)
@@ -10,22 +18,46 @@ class ArffExporter(Exporter):
         self._arff_max_fetched_values = 30
         self._arff_max_class_value = 10
         self._arff_fetched_values = {}
+        self._arff_fetched_values_sets = {}
         self._arff_guessed_types = {}
 
     def _export(self, file_data_generator):
-        (generator1, generator2) = itertools.tee(file_data_generator, 2)
-        self._guess_types(generator1)
-
-        f = self.get_file_handle()
-        f.write(self._get_arff_header())
+        spill_file = tempfile.TemporaryFile()
+        try:
+            self._guess_types(self._spill(file_data_generator, spill_file))
+
+            f = self.get_file_handle()
+            f.write(self._get_arff_header())
+
+            first = True
+            spill_file.seek(0)
+            for value_point in self._read_spilled(spill_file):
+                if first:
+                    f.write("\n")
+                else:
+                    first = False
+                f.write(self._get_arff_row_value_point(value_point))
+        finally:
+            spill_file.close()
+
+    def _spill(self, file_data_generator, spill_file):
+        """
+        Yield the value points once written to the spill file
+        """
+        pickler = cPickle.Pickler(spill_file, cPickle.HIGHEST_PROTOCOL)
+        # the pickler would otherwise keep a reference to every value point
+        pickler.fast = True
+        for value_point in file_data_generator:
+            pickler.dump(value_point)
+            yield value_point
 
-        first = True
-        for value_point in generator2:
-            if first:
-                f.write("\n")
-            else:
-                first = False
-            f.write(self._get_arff_row_value_point(value_point))
+    def _read_spilled(self, spill_file):
+        unpickler = cPickle.Unpickler(spill_file)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
 
     def _get_value_array_generator(self, file_data_generator):
         for value_point in file_data_generator:
@@ -46,15 +78,24 @@ class ArffExporter(Exporter):
 
     def _register_fetched_value(self, value_point):
         done = True
-        for (key, value) in value_point.items():
-            if key not in self._arff_fetched_values.keys():
+        for (key, value) in value_point.iteritems():
+            if key not in self._arff_fetched_values:
                 self._arff_fetched_values[key] = []
-            if len(self._arff_fetched_values[key]) \
-                    < self._arff_max_fetched_values:
-                done = False
-            if value in self._arff_fetched_values[key]:
+                self._arff_fetched_values_sets[key] = set()
+            fetched_values = self._arff_fetched_values[key]
+            if len(fetched_values) >= self._arff_max_fetched_values:
                 continue
-            self._arff_fetched_values[key].append(value)
+            done = False
+            fetched_values_set = self._arff_fetched_values_sets[key]
+            try:
+                if value in fetched_values_set:
+                    continue
+                fetched_values_set.add(value)
+            except TypeError:
+                # unhashable values
+                if value in fetched_values:
+                    continue
+            fetched_values.append(value)
         return done
 
     def _compute_types(self):
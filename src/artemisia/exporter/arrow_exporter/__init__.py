@@ -0,0 +1,86 @@
+from artemisia.exporter.columnar_exporter import ColumnarExporter
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ArrowExporter(ColumnarExporter):
+    """
+    The base of the exporters relying on pyarrow: every chunk is converted to
+    an arrow table, the schema being the one of the first chunk (columns
+    holding numbers only there are exported as numbers, columns without any
+    value as strings)
+    """
+
+    def __init__(self):
+        if pyarrow is None:
+            raise Exception('pyarrow is required for the feather and parquet '
+                            'exports')
+        ColumnarExporter.__init__(self)
+        self._types = None
+        self._writer = None
+
+    def _write_chunk(self, f, columns):
+        arrays = [self._get_arrow_array(column, values)
+                  for (column, values) in columns]
+        if self._types is None:
+            self._types = {column: array.type for ((column, values), array)
+                           in zip(columns, arrays)}
+            schema = pyarrow.schema(
+                [pyarrow.field(column, array.type)
+                 for ((column, values), array) in zip(columns, arrays)])
+            self._writer = self._get_writer(f, schema)
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            arrays, names=[column for (column, values) in columns]))
+
+    def _end(self, f):
+        self._writer.close()
+
+    def _get_writer(self, f, schema):
+        raise NotImplementedError("Please implement this method in a subclass")
+
+    def _get_arrow_array(self, column, values):
+        if self._types is None:
+            if values.dtype.kind == 'S':
+                # python 2 strings would be inferred as binary
+                return pyarrow.array(values.tolist(), type=pyarrow.string())
+            if values.dtype.kind == 'O':
+                array = pyarrow.array(values.tolist())
+                if array.type == pyarrow.null():
+                    array = pyarrow.array(values.tolist(),
+                                          type=pyarrow.string())
+                return array
+            return pyarrow.array(values)
+        arrow_type = self._types[column]
+        if pyarrow.types.is_floating(arrow_type) \
+                & (values.dtype.kind in ['b', 'i', 'u']):
+            values = values.astype(float)
+        try:
+            if values.dtype.kind in ['S', 'O']:
+                return pyarrow.array(values.tolist(), type=arrow_type)
+            return pyarrow.array(values, type=arrow_type)
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            raise Exception('The values of ' + column + ' do not match its '
+                            'type (' + str(arrow_type) + ') in the first '
+                            'value points')
+
+
+class FeatherExporter(ArrowExporter):
+    """
+    Export to an arrow IPC file (the format of feather version 2), one record
+    batch per chunk
+    """
+
+    def _get_writer(self, f, schema):
+        return pyarrow.RecordBatchFileWriter(f, schema)
+
+
+class ParquetExporter(ArrowExporter):
+    """
+    Export to a parquet file, one row group per chunk
+    """
+
+    def _get_writer(self, f, schema):
+        return pyarrow.parquet.ParquetWriter(f, schema)
@@ -0,0 +1,53 @@
+from artemisia.exporter.abstract_exporter import Exporter
+from artemisia.batch import to_array
+
+
+class ColumnarExporter(Exporter):
+    """
+    The base of the binary columnar exporters: the value points are gathered
+    in chunks of _row_group_size value points, converted to numpy columns and
+    given to _write_chunk()
+    """
+
+    def __init__(self):
+        Exporter.__init__(self)
+        self._binary = True
+        self._row_group_size = 65536
+
+    def _export(self, file_data_generator):
+        f = self.get_file_handle()
+        chunk = []
+        chunks_count = 0
+        for value_point in file_data_generator:
+            chunk.append(value_point)
+            if len(chunk) >= self._row_group_size:
+                self._write_chunk(f, self._get_chunk_columns(chunk))
+                chunks_count += 1
+                chunk = []
+        # an empty export still gets its columns
+        if (len(chunk) != 0) | (chunks_count == 0):
+            self._write_chunk(f, self._get_chunk_columns(chunk))
+        self._end(f)
+
+    def _write_chunk(self, f, columns):
+        """
+        Write the (column, numpy array) tuples of a chunk
+        """
+        raise NotImplementedError("Please implement this method in a subclass")
+
+    def _end(self, f):
+        pass
+
+    def _get_chunk_columns(self, chunk):
+        """
+        Return the (column, numpy array) tuples of the value points of a
+        chunk, strings are stored in string arrays rather than object arrays
+        """
+        columns = []
+        for column in self._columns or []:
+            values = to_array([value_point[column] for value_point in chunk])
+            if (values.dtype == object) & (len(values) != 0):
+                if all(isinstance(value, str) for value in values.tolist()):
+                    values = values.astype(str)
+            columns.append((column, values))
+        return columns
@@ -0,0 +1,80 @@
+from artemisia.exporter.columnar_exporter import ColumnarExporter
+from artemisia.batch import ValuePointBatch
+from StringIO import StringIO
+import zipfile
+import numpy
+
+
+class NpzExporter(ColumnarExporter):
+    """
+    Export to a numpy .npz file, written chunk by chunk: it holds a 'fields'
+    array, a 'length', a 'chunks' count and one 'column_N_C' array per field
+    and chunk (N being the index of the field, C the one of the chunk).
+    NpzExporter.load() reads it back as a ValuePointBatch.
+    """
+
+    def __init__(self):
+        ColumnarExporter.__init__(self)
+        self._zip_file = None
+        self._fields = None
+        self._chunks_count = 0
+        self._length = 0
+
+    @staticmethod
+    def load(file_path):
+        """
+        Return the exported value points as a ValuePointBatch, the chunks of
+        every column being concatenated
+        """
+        data = numpy.load(file_path, allow_pickle=True)
+        try:
+            fields = data['fields'].tolist()
+            chunks_count = int(data['chunks'])
+            columns = {}
+            for (index, field) in enumerate(fields):
+                columns[field] = _concatenate(
+                    [data['column_%d_%d' % (index, chunk_index)]
+                     for chunk_index in range(chunks_count)])
+            length = int(data['length'])
+        finally:
+            data.close()
+        return ValuePointBatch(columns, fields, length)
+
+    def _write_chunk(self, f, columns):
+        fields = [column for (column, values) in columns]
+        if self._zip_file is None:
+            self._zip_file = zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED,
+                                             allowZip64=True)
+            self._fields = fields
+        if fields != self._fields:
+            raise Exception('The chunk columns ' + ', '.join(fields)
+                            + ' differ from ' + ', '.join(self._fields))
+        for (index, (column, values)) in enumerate(columns):
+            self._write_array('column_%d_%d' % (index, self._chunks_count),
+                              values)
+        self._chunks_count += 1
+        if len(columns) != 0:
+            self._length += len(columns[0][1])
+
+    def _end(self, f):
+        self._write_array('fields', numpy.array(self._fields, dtype=str))
+        self._write_array('length', numpy.array(self._length))
+        self._write_array('chunks', numpy.array(self._chunks_count))
+        self._zip_file.close()
+        self._zip_file = None
+
+    def _write_array(self, name, array):
+        array_file = StringIO()
+        numpy.lib.format.write_array(array_file, array, allow_pickle=True)
+        self._zip_file.writestr(name + '.npy', array_file.getvalue())
+
+
+def _concatenate(chunks):
+    """
+    Concatenate the chunks of a column, mixing numbers and strings ends up in
+    an object array
+    """
+    kinds = set(chunk.dtype.kind for chunk in chunks if len(chunk) != 0)
+    if (len(kinds) > 1) & bool(kinds & set(['S', 'U', 'O'])):
+        chunks = [chunk.astype(object) for chunk in chunks]
+    return numpy.concatenate(chunks)
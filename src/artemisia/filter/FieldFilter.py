@@ -1,4 +1,7 @@
 import types
+import numpy
+
+from artemisia.filter.expression import ComparisonPredicate
 
 
 class FieldFilter:
@@ -17,8 +20,9 @@ class FieldFilter:
         if (filter_arg.strip() == "not") and (args[0].strip() == "in"):
             filter_arg = "not in"
             args.pop(0)
-        self._filter_func = self._filter_func_from_arg(filter_arg)
+        self._filter_arg = filter_arg
         self._extra_args = args
+        self._filter_func = self._filter_func_from_arg(filter_arg)
 
     def match(self, file_data):
         if isinstance(file_data, types.ListType):
@@ -26,18 +30,27 @@ class FieldFilter:
         else:
             return self._match_value_point(file_data)
 
+    def match_batch(self, batch):
+        """
+        Return a boolean mask of the value points of the batch matching the
+        filter
+        """
+        column = self._get_field_column(batch)
+        if column is None:
+            # as for a value point without the field
+            return numpy.repeat(bool(self._match_value_point({})),
+                                len(batch))
+        if self._predicate is not None:
+            return self._predicate.mask(column)
+        return numpy.fromiter((self._filter_func(value, *self._extra_args)
+                               for value in column.tolist()),
+                              dtype=bool, count=len(column))
+
     def get_target_field(self):
         return self._target_field
 
-    def _match_value_point(self, value_point):
-        field_value = self._get_field_value(value_point)
-
-        if field_value is None:
-            return False
-
-        filter_args = [field_value] + self._extra_args
-        match = self._filter_func(*filter_args)
-        return match
+    def get_target_fields(self):
+        return [self._target_field]
 
     def _match_file_data(self, file_data):
         value_point = file_data[0]
@@ -66,6 +79,8 @@ class FieldFilter:
 
     def _match_value_point(self, value_point):
         field_value = self._get_field_value(value_point)
+        if self._predicate is not None:
+            return self._predicate.match_value(field_value)
         filter_args = [field_value] + self._extra_args
         return self._filter_func(*filter_args)
 
@@ -84,47 +99,35 @@ class FieldFilter:
 
         return abs(value_point[clean_field])
 
+    def _get_field_column(self, batch):
+        if batch.has_field(self._target_field):
+            return batch.get_column(self._target_field)
+
+        if (self._target_field[0] != '|') | \
+            (self._target_field[-1] != '|'):
+            return None
+
+        clean_field = self._target_field[1:-1]
+        if not batch.has_field(clean_field):
+            return None
+
+        return numpy.abs(batch.get_column(clean_field))
+
     def _filter_func_from_arg(self, arg):
+        self._predicate = None
         if isinstance(arg, types.FunctionType):
             return arg
-        if arg == 'not in':
-            def filter_func(*args):
-                args = list(args)
-                value = args.pop(0)
-                return not (value in args)
-            return filter_func
-        if arg == 'in':
-            def filter_func(*args):
-                args = list(args)
-                value = args.pop(0)
-                return value in args
-            return filter_func
-        if arg in ['!=', '=', '<', '<=', '>', '>=']:
-            def filter_func(value, comparison_value):
-                try:
-                    value = float(value)
-                    comparison_value = float(comparison_value)
-                except (ValueError):
-                    # We may have strings
-                    value = str(value).lower()
-                    comparison_value = str(comparison_value).lower()
-                if arg == '=':
-                    return value == comparison_value
-                if arg == '!=':
-                    return value != comparison_value
-                if arg == '<':
-                    return value < comparison_value
-                if arg == '<=':
-                    return value <= comparison_value
-                if arg == '>':
-                    return value > comparison_value
-                if arg == '>=':
-                    return value >= comparison_value
-            return filter_func
-        if isinstance(arg, types.StringType):
-            arg = arg.lower()
-
-            def is_in(value):
-                return arg in value.lower()
-            return is_in
-        raise Exception("Dafuq are you sending as input to this function?")
+        # the type of the compared values is resolved once, here
+        if arg in ['in', 'not in']:
+            self._predicate = ComparisonPredicate(arg, self._extra_args)
+        elif arg in ['!=', '=', '<', '<=', '>', '>=']:
+            self._predicate = ComparisonPredicate(arg, self._extra_args[:1])
+        elif isinstance(arg, types.StringType):
+            self._predicate = ComparisonPredicate('contains', [arg])
+        else:
+            raise Exception("Dafuq are you sending as input to this function?")
+        match_value = self._predicate.match_value
+
+        def filter_func(value, *extra_args):
+            return match_value(value)
+        return filter_func
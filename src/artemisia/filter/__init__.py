@@ -1,7 +1,10 @@
 import types
 import re
+import numpy
 from artemisia.filter.FieldFilter import FieldFilter
+from artemisia.filter.expression import FilterExpression
 import artemisia.helper as ahelper
+from artemisia.batch import ValuePointBatch
 
 
 class FilterManager:
@@ -13,8 +16,9 @@ class FilterManager:
     def __init__(self):
         self._file_data_filters = []
         self._first_to_match_filters = []
+        self._pushed_down_filters = []
 
-        self._filter_re = re.compile('^\s*\(((?:,?(?:[^,]+))+)\)\s*$')
+        self._filter_re = re.compile('^\s*\(([^()]+)\)\s*$')
 
     def add_file_data_filter(self, *args):
         """
@@ -24,10 +28,10 @@ class FilterManager:
           * filter_func, function|string, the function to apply
           * filter_func_extra_arg
           * ...
+
+        or a single filter expression like "price < 10 and seller in a b"
         """
-        if isinstance(args[0], types.StringType) & (len(args) == 1):
-            args = self._parse_filter(args[0])
-        self._file_data_filters.append(FieldFilter(*args))
+        self._file_data_filters.append(self._get_filter(args))
 
     def add_first_to_match_filter(self, *args):
         """
@@ -41,9 +45,7 @@ class FilterManager:
         if args[0] == "last":
             self._first_to_match_filters.append(args[0])
             return
-        if isinstance(args[0], types.StringType) & (len(args) == 1):
-            args = self._parse_filter(args[0])
-        self._first_to_match_filters.append(FieldFilter(*args))
+        self._first_to_match_filters.append(self._get_filter(args))
 
     def filter(self, data_generator):
         """
@@ -55,6 +57,12 @@ class FilterManager:
         if self._should_flatten_generator():
             data_generator = self._flatten(data_generator)
         for file_data in data_generator:
+            if isinstance(file_data, ValuePointBatch) \
+                    & self._should_flatten_generator():
+                batch = self._filter_batch(file_data)
+                if len(batch) != 0:
+                    yield batch
+                continue
             if isinstance(file_data, types.GeneratorType):
                 file_data = [value_point for value_point in file_data]
             if self._data_matches_filters(file_data):
@@ -66,14 +74,89 @@ class FilterManager:
                         continue
                     yield value_point
 
+    def push_down(self, modified_columns):
+        """
+        Return a FilterManager with the file data filters that do not depend on
+        the modified columns, so that they are applied while loading the data
+        (see DataLoader.set_filter_manager()), or None. Those filters are not
+        evaluated by this manager anymore.
+        """
+        if modified_columns is None:
+            return None
+        filter_manager = FilterManager()
+        for single_filter in self._file_data_filters[:]:
+            fields = self._get_filter_fields(single_filter)
+            if any(field.strip('|') in modified_columns for field in fields):
+                continue
+            filter_manager._file_data_filters.append(single_filter)
+            self._file_data_filters.remove(single_filter)
+            self._pushed_down_filters.append(single_filter)
+        if len(filter_manager._file_data_filters) == 0:
+            return None
+        return filter_manager
+
+    def get_selection_filters(self, modified_columns):
+        """
+        Return the first to match filters when none depends on the modified
+        columns, so that the DataLoader only loads the value points they may
+        pick (see DataLoader.set_first_to_match_filters()), or None
+        """
+        if (modified_columns is None) | self._should_flatten_generator():
+            return None
+        for single_filter in self._first_to_match_filters:
+            fields = self._get_filter_fields(single_filter)
+            if any(field.strip('|') in modified_columns for field in fields):
+                return None
+        return self._first_to_match_filters[:]
+
+    def filters_files(self):
+        """
+        Tell whether the file data filters are applied to whole files (to their
+        last value point, when a value point is picked per file) rather than to
+        every value point
+        """
+        return not self._should_flatten_generator()
+
+    def matches(self, data):
+        """
+        Tell whether a value point, or the last value point of a file data,
+        matches the file data filters
+        """
+        return self._data_matches_filters(data)
+
+    def get_batch_mask(self, batch):
+        """
+        Return the boolean mask of the value points of a batch matching the
+        file data filters
+        """
+        mask = numpy.ones(len(batch), dtype=bool)
+        for field_filter in self._file_data_filters:
+            mask &= field_filter.match_batch(batch)
+        return mask
+
     def get_target_fields(self):
         fields = []
         for single_filter in \
-            (self._first_to_match_filters + self._file_data_filters):
-            if isinstance(single_filter, FieldFilter):
-                fields.append(single_filter.get_target_field())
+            (self._first_to_match_filters + self._file_data_filters
+             + self._pushed_down_filters):
+            fields += self._get_filter_fields(single_filter)
         return fields
 
+    def _get_filter_fields(self, single_filter):
+        if isinstance(single_filter, FieldFilter):
+            return [single_filter.get_target_field()]
+        if isinstance(single_filter, FilterExpression):
+            return single_filter.get_target_fields()
+        return []
+
+    def _get_filter(self, args):
+        if isinstance(args[0], types.StringType) & (len(args) == 1):
+            filter_elements = self._parse_filter(args[0])
+            if filter_elements is None:
+                return FilterExpression(args[0])
+            args = filter_elements
+        return FieldFilter(*args)
+
     def _flatten(self, generator):
         """
         if the generator yield dictionaries, this function will yield
@@ -81,8 +164,16 @@ class FilterManager:
         the arrays values.
         """
         helper = ahelper.Helper()
-        for v in helper.flatten(generator):
-            yield v
+        for item in generator:
+            if isinstance(item, ValuePointBatch):
+                # batches are filtered as a whole
+                yield item
+                continue
+            for v in helper.flatten([item]):
+                yield v
+
+    def _filter_batch(self, batch):
+        return batch.select(self.get_batch_mask(batch))
 
     def _data_matches_filters(self, data):
         """
@@ -93,7 +184,9 @@ class FilterManager:
         """
         if isinstance(data, types.DictionaryType):
             value_point = data
-        elif isinstance(data, types.ListType):
+        elif isinstance(data, (types.ListType, ValuePointBatch)):
+            if len(data) == 0:
+                return False
             value_point = data[-1]
         else:
             raise Exception("Unexpected file data")
@@ -103,6 +196,8 @@ class FilterManager:
         return True
 
     def _extract_data_point(self, file_data):
+        if isinstance(file_data, ValuePointBatch):
+            return self._extract_batch_data_point(file_data)
         if not isinstance(file_data, types.ListType):
             raise Exception("Unexpected input type")
         if len(self._first_to_match_filters) == 0:
@@ -117,15 +212,40 @@ class FilterManager:
                     continue
                 return value_point
 
+    def _extract_batch_data_point(self, batch):
+        """
+        Same as _extract_data_point() with the masks of the first to match
+        filters computed over the whole batch
+        """
+        if len(batch) == 0:
+            return
+        masks = []
+        for field_filter in self._first_to_match_filters:
+            if field_filter == "last":
+                # only the first value point can be checked before "last"
+                if any(mask[0] for mask in masks):
+                    return batch[0]
+                return batch[-1]
+            masks.append(field_filter.match_batch(batch))
+        matching_indexes = numpy.flatnonzero(numpy.logical_or.reduce(masks))
+        if len(matching_indexes) == 0:
+            return
+        return batch[matching_indexes[0]]
+
     def _should_flatten_generator(self):
         return len(self._first_to_match_filters) == 0
 
     def _parse_filter(self, filter_string):
+        """
+        Return the elements of a filter written as (field,operator,value), None
+        for the filter expressions
+        """
         filter_string = filter_string.strip()
         match = self._filter_re.match(filter_string)
         if match is None:
-            filter_elements = filter_string.split(' ')
-            return filter_elements
-        stripped = match.group(0)[1:-1]
-        filter_elements = stripped.split(',')
+            return None
+        filter_elements = match.group(1).split(',')
+        if len(filter_elements) < 2:
+            # a parenthesized expression
+            return None
         return filter_elements
\ No newline at end of file
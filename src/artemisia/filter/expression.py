@@ -0,0 +1,431 @@
+import re
+import types
+import operator
+import numpy
+
+
+comparison_operators = {'=': operator.eq, '==': operator.eq,
+                        '!=': operator.ne,
+                        '<': operator.lt, '<=': operator.le,
+                        '>': operator.gt, '>=': operator.ge}
+
+numeric_types = (types.IntType, types.LongType, types.FloatType)
+
+
+def parse_literal(literal):
+    """
+    Return the literal as a float if it looks like a number
+    """
+    if not isinstance(literal, types.StringTypes):
+        return literal
+    try:
+        return float(literal)
+    except ValueError:
+        return literal
+
+
+class ComparisonPredicate:
+    """
+    The predicate comparing a value to literals, the operator is one of the
+    comparison operators, 'in', 'not in' or 'contains' (case insensitive
+    substring). The type of the literals is resolved once, when the predicate
+    is built, match_value() is then a single closure.
+    """
+
+    def __init__(self, comparison_operator, raw_literals, literals=None):
+        if literals is None:
+            literals = [parse_literal(literal) for literal in raw_literals]
+        self._operator = comparison_operator
+        self._raw_literals = raw_literals
+        self._literals = literals
+        self.match_value = self._compile()
+
+    def mask(self, column):
+        """
+        Return the boolean mask of the values of a numpy array matching the
+        predicate
+        """
+        if column.dtype != object:
+            numeric_literals = [literal for literal in self._literals
+                                if isinstance(literal, numeric_types)]
+            if (self._operator in comparison_operators) \
+                    & (len(numeric_literals) == 1):
+                compare = comparison_operators[self._operator]
+                return compare(column, numeric_literals[0])
+            if self._operator in ['in', 'not in']:
+                mask = numpy.in1d(column, numeric_literals)
+                if self._operator == 'not in':
+                    mask = ~mask
+                return mask
+        return numpy.fromiter((self.match_value(value)
+                               for value in column.tolist()),
+                              dtype=bool, count=len(column))
+
+    def _compile(self):
+        if self._operator in ['in', 'not in']:
+            return self._compile_in()
+        if self._operator == 'contains':
+            return self._compile_contains()
+        if self._operator in comparison_operators:
+            return self._compile_comparison()
+        raise Exception('Unexpected operator ' + str(self._operator))
+
+    def _compile_in(self):
+        accepted_values = set(self._raw_literals) | set(self._literals)
+        expected = self._operator == 'in'
+
+        def match_value(value):
+            try:
+                return (value in accepted_values) == expected
+            except TypeError:
+                # unhashable values
+                return not expected
+        return match_value
+
+    def _compile_contains(self):
+        contained = str(self._raw_literals[0]).lower()
+
+        def match_value(value):
+            if value is None:
+                return False
+            return contained in str(value).lower()
+        return match_value
+
+    def _compile_comparison(self):
+        if len(self._literals) != 1:
+            raise Exception('Comparison operators expect a single value')
+        compare = comparison_operators[self._operator]
+        literal = self._literals[0]
+        lower_literal = str(self._raw_literals[0]).lower()
+
+        if not isinstance(literal, numeric_types):
+            def match_value(value):
+                if value is None:
+                    return False
+                return compare(str(value).lower(), lower_literal)
+            return match_value
+
+        def match_value(value):
+            if type(value) in numeric_types:
+                return compare(value, literal)
+            if value is None:
+                return False
+            try:
+                return compare(float(value), literal)
+            except (ValueError, TypeError):
+                # We may have strings
+                return compare(str(value).lower(), lower_literal)
+        return match_value
+
+
+class FilterExpression:
+    """
+    A filter compiled from a string like:
+
+        price < 10 and (seller in amazon apple or not color = 'dark red')
+
+    Supported: comparison operators (=, !=, <, <=, >, >=), 'in' and 'not in'
+    followed by values (optionally as '(a, b)'), a single value for a
+    substring match ('problem solution'), 'and', 'or', 'not', parentheses,
+    quoted strings and |field| for absolute values. Values looking like numbers
+    are compared as numbers.
+    """
+
+    def __init__(self, expression_string):
+        self._expression_string = expression_string
+        parser = _Parser(tokenize(expression_string), expression_string)
+        self._root = parser.parse()
+        self._match = self._root.compile()
+
+    def match(self, value_point):
+        return self._match(value_point)
+
+    def match_batch(self, batch):
+        """
+        Return a boolean mask of the value points of the batch matching the
+        expression
+        """
+        return self._root.mask(batch)
+
+    def get_target_fields(self):
+        fields = []
+        for field in self._root.get_fields():
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+    def __str__(self):
+        return self._expression_string
+
+
+_token_re = re.compile(r'''\s*(?:
+    (?P<string>'[^']*'|"[^"]*")
+    |(?P<operator>==|!=|<=|>=|=|<|>)
+    |(?P<punctuation>[(),])
+    |(?P<word>[^\s()',"=!<>]+)
+    )''', re.VERBOSE)
+
+_keywords = ['and', 'or', 'not', 'in']
+
+
+def tokenize(expression_string):
+    """
+    Return the tokens of an expression as (kind, text) tuples
+    """
+    tokens = []
+    position = 0
+    expression_string = expression_string.rstrip()
+    while position < len(expression_string):
+        match = _token_re.match(expression_string, position)
+        if (match is None) or (match.end() == position):
+            raise Exception('Unable to parse the filter "' + expression_string
+                            + '" at position ' + str(position))
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            text = text[1:-1]
+        elif kind == 'punctuation':
+            kind = text
+        elif (kind == 'word') and (text.lower() in _keywords):
+            kind = text.lower()
+            text = text.lower()
+        tokens.append((kind, text))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser of the filter expressions:
+
+        expression := and_expression ('or' and_expression)*
+        and_expression := not_expression ('and' not_expression)*
+        not_expression := 'not' not_expression | '(' expression ')'
+                          | comparison
+    """
+
+    def __init__(self, tokens, expression_string):
+        self._tokens = tokens
+        self._position = 0
+        self._expression_string = expression_string
+
+    def parse(self):
+        node = self._parse_or()
+        if self._peek() is not None:
+            self._fail('unexpected "' + self._peek()[1] + '"')
+        return node
+
+    def _parse_or(self):
+        nodes = [self._parse_and()]
+        while self._peek_kind() == 'or':
+            self._next()
+            nodes.append(self._parse_and())
+        if len(nodes) == 1:
+            return nodes[0]
+        return _Or(nodes)
+
+    def _parse_and(self):
+        nodes = [self._parse_not()]
+        while self._peek_kind() == 'and':
+            self._next()
+            nodes.append(self._parse_not())
+        if len(nodes) == 1:
+            return nodes[0]
+        return _And(nodes)
+
+    def _parse_not(self):
+        kind = self._peek_kind()
+        if kind == 'not':
+            self._next()
+            return _Not(self._parse_not())
+        if kind == '(':
+            self._next()
+            node = self._parse_or()
+            self._expect(')')
+            return node
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        field = self._expect('word')[1]
+        kind = self._peek_kind()
+        if kind == 'operator':
+            comparison_operator = self._next()[1]
+            return _Comparison(field, comparison_operator,
+                               [self._parse_literal()])
+        if kind == 'not':
+            self._next()
+            self._expect('in')
+            return _Comparison(field, 'not in', self._parse_literals())
+        if kind == 'in':
+            self._next()
+            return _Comparison(field, 'in', self._parse_literals())
+        if kind in ['word', 'string']:
+            return _Comparison(field, 'contains', [self._parse_literal()])
+        self._fail('an operator is expected after ' + field)
+
+    def _parse_literals(self):
+        literals = []
+        if self._peek_kind() == '(':
+            self._next()
+            literals.append(self._parse_literal())
+            while self._peek_kind() == ',':
+                self._next()
+                literals.append(self._parse_literal())
+            self._expect(')')
+            return literals
+        while self._peek_kind() in ['word', 'string']:
+            literals.append(self._parse_literal())
+        if len(literals) == 0:
+            self._fail('values are expected after in')
+        return literals
+
+    def _parse_literal(self):
+        token = self._next()
+        if token is None:
+            self._fail('a value is expected')
+        (kind, text) = token
+        if kind == 'string':
+            return (text, text)
+        if kind == 'word':
+            return (text, parse_literal(text))
+        self._fail('unexpected "' + text + '"')
+
+    def _peek(self):
+        if self._position >= len(self._tokens):
+            return None
+        return self._tokens[self._position]
+
+    def _peek_kind(self):
+        token = self._peek()
+        if token is None:
+            return None
+        return token[0]
+
+    def _next(self):
+        token = self._peek()
+        self._position += 1
+        return token
+
+    def _expect(self, kind):
+        token = self._next()
+        if (token is None) or (token[0] != kind):
+            self._fail(kind + ' is expected')
+        return token
+
+    def _fail(self, message):
+        raise Exception('Unable to parse the filter "'
+                        + self._expression_string + '": ' + message)
+
+
+class _Comparison:
+
+    def __init__(self, field, comparison_operator, literals):
+        self._absolute = (len(field) > 2) & field.startswith('|') \
+            & field.endswith('|')
+        if self._absolute:
+            field = field[1:-1]
+        self._field = field
+        self._predicate = ComparisonPredicate(
+            comparison_operator, [literal[0] for literal in literals],
+            [literal[1] for literal in literals])
+
+    def compile(self):
+        field = self._field
+        match_value = self._predicate.match_value
+        if not self._absolute:
+            def match(value_point):
+                return match_value(value_point.get(field))
+            return match
+
+        def match_absolute(value_point):
+            value = value_point.get(field)
+            if value is not None:
+                value = abs(value)
+            return match_value(value)
+        return match_absolute
+
+    def mask(self, batch):
+        if not batch.has_field(self._field):
+            return numpy.repeat(self._predicate.match_value(None), len(batch))
+        column = batch.get_column(self._field)
+        if self._absolute:
+            if column.dtype == object:
+                absolute_column = numpy.empty(len(column), dtype=object)
+                absolute_column[:] = [value if value is None else abs(value)
+                                      for value in column]
+                column = absolute_column
+            else:
+                column = numpy.abs(column)
+        return self._predicate.mask(column)
+
+    def get_fields(self):
+        return [self._field]
+
+
+class _And:
+
+    def __init__(self, nodes):
+        self._nodes = nodes
+
+    def compile(self):
+        matches = [node.compile() for node in self._nodes]
+
+        def match(value_point):
+            for node_match in matches:
+                if not node_match(value_point):
+                    return False
+            return True
+        return match
+
+    def mask(self, batch):
+        mask = numpy.ones(len(batch), dtype=bool)
+        for node in self._nodes:
+            mask &= node.mask(batch)
+        return mask
+
+    def get_fields(self):
+        return [field for node in self._nodes for field in node.get_fields()]
+
+
+class _Or:
+
+    def __init__(self, nodes):
+        self._nodes = nodes
+
+    def compile(self):
+        matches = [node.compile() for node in self._nodes]
+
+        def match(value_point):
+            for node_match in matches:
+                if node_match(value_point):
+                    return True
+            return False
+        return match
+
+    def mask(self, batch):
+        mask = numpy.zeros(len(batch), dtype=bool)
+        for node in self._nodes:
+            mask |= node.mask(batch)
+        return mask
+
+    def get_fields(self):
+        return [field for node in self._nodes for field in node.get_fields()]
+
+
+class _Not:
+
+    def __init__(self, node):
+        self._node = node
+
+    def compile(self):
+        node_match = self._node.compile()
+
+        def match(value_point):
+            return not node_match(value_point)
+        return match
+
+    def mask(self, batch):
+        return ~self._node.mask(batch)
+
+    def get_fields(self):
+        return self._node.get_fields()
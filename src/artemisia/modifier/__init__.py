@@ -1,8 +1,13 @@
 import types
 import sys
 import os
+import collections
+import itertools
+import multiprocessing
+import traceback
 from numpy.distutils.system_info import BlasNotFoundError
 
+from artemisia.batch import ValuePointBatch
 import cluster as cluster_modifier
 import normalizer as normalizer_modifier
 
@@ -10,23 +15,67 @@ import normalizer as normalizer_modifier
 class Modifier:
     """
     A modifier is used to alter value_points contains within a generator
+
+    The function may carry a `batch_modifier` attribute, a function altering a
+    whole ValuePointBatch at once. Without it batches are converted to
+    dictionaries and back.
+
+    The column is the one the modifier computes, None when unknown. The fields
+    the function reads may be declared with an `input_fields` attribute, the
+    ones it computes with an `output_fields` attribute (the column by default).
+    A `keeps_value_points` attribute set to True tells that the function
+    returns every value point it is given.
     """
 
-    def __init__(self, func):
+    def __init__(self, func, column=None):
         self._func = func
+        self._batch_func = getattr(func, 'batch_modifier', None)
+        self._input_fields = getattr(func, 'input_fields', None)
+        self._output_fields = get_output_fields(func, column)
+        self._declares_output_fields = hasattr(func, 'output_fields')
+        self._keeps_value_points = getattr(func, 'keeps_value_points', False)
+        self._column = column
+
+    def get_func(self):
+        return self._func
+
+    def get_batch_func(self):
+        return self._batch_func
+
+    def get_column(self):
+        return self._column
+
+    def get_input_fields(self):
+        return self._input_fields
+
+    def get_output_fields(self):
+        return self._output_fields
+
+    def declares_effects(self):
+        """
+        Tell whether the modifier declares every field it alters and returns
+        every value point, the filters not depending on its output fields can
+        then be applied before it runs
+        """
+        return self._declares_output_fields & self._keeps_value_points
 
     def run(self, data_generator):
+        received_at_least_one = False
         found_at_least_one = False
         for value_point in data_generator:
+            received_at_least_one = True
             modified_value_point = self._run_for_value_point(value_point)
             if modified_value_point is not None:
                 yield modified_value_point
                 found_at_least_one = True
-        if not found_at_least_one:
+        # the data may have been entirely filtered out upstream
+        if received_at_least_one and not found_at_least_one:
             raise Exception('Modifier build on ' + self._func.__name__ + '() '
                             'did\'t returned anything')
 
     def _run_for_value_point(self, value_point):
+        if isinstance(value_point, ValuePointBatch):
+            return self._run_for_batch(value_point)
         if isinstance(value_point, types.GeneratorType):
             value_point = [d for d in value_point]
         if isinstance(value_point, types.ListType):
@@ -41,6 +90,144 @@ class Modifier:
             if modified_value_point is not None:
                 return modified_value_point
 
+    def _run_for_batch(self, batch):
+        if self._batch_func is not None:
+            return self._batch_func(batch)
+        modified_value_points = \
+            self._run_for_value_point(batch.to_value_points())
+        return ValuePointBatch.from_value_points(modified_value_points)
+
+
+class ModifierChain:
+    """
+    A list of modifiers applied in a single pass: every value point goes
+    through all of them at once, rather than through a generator per modifier
+    and a new list per file data and per modifier. The consecutive modifiers
+    without a batch function are applied to batches through a single
+    conversion to dictionaries.
+    """
+
+    def __init__(self, modifiers):
+        self._modifiers = modifiers
+        self._funcs = tuple(modifier.get_func() for modifier in modifiers)
+        self._batch_stages = self._get_batch_stages()
+
+    def run(self, data_generator):
+        """
+        Same as running the modifiers one after the other with Modifier.run()
+        """
+        received_at_least_one = False
+        # the index of the last modifier a value point went through
+        reached_index = -1
+        modifiers_count = len(self._modifiers)
+        funcs = self._funcs
+        for data in data_generator:
+            received_at_least_one = True
+            if isinstance(data, types.DictType):
+                index = 0
+                while (data is not None) and (index < modifiers_count):
+                    data = funcs[index](data)
+                    index += 1
+                if data is None:
+                    reached_index = max(reached_index, index - 1)
+                    continue
+                reached_index = modifiers_count
+                yield data
+                continue
+            reached_index = modifiers_count
+            yield self.run_for_data(data)
+        self.check(received_at_least_one, reached_index)
+
+    def check(self, received_at_least_one, reached_index):
+        """
+        Fail when value points were received but none went through a
+        modifier, reached_index being the index of the last modifier a value
+        point went through
+        """
+        # the data may have been entirely filtered out upstream
+        if received_at_least_one and (reached_index < len(self._modifiers)):
+            func = self._funcs[reached_index]
+            raise Exception('Modifier build on ' + func.__name__ + '() '
+                            'did\'t returned anything')
+
+    def run_for_value_points(self, value_points):
+        """
+        Modify value points given one by one to run(), return the modified
+        ones along with the index of the last modifier a value point went
+        through (see check())
+        """
+        modified_value_points = []
+        reached_index = -1
+        for value_point in value_points:
+            for (index, func) in enumerate(self._funcs):
+                value_point = func(value_point)
+                if value_point is None:
+                    reached_index = max(reached_index, index)
+                    break
+            else:
+                reached_index = len(self._funcs)
+                modified_value_points.append(value_point)
+        return (modified_value_points, reached_index)
+
+    def run_for_data(self, data):
+        """
+        Modify a file data (a list or a generator of value points) or a
+        ValuePointBatch
+        """
+        if isinstance(data, ValuePointBatch):
+            return self._run_for_batch(data)
+        return self._modify_value_points(data, self._funcs)
+
+    def _run_for_batch(self, batch):
+        for (batch_func, funcs) in self._batch_stages:
+            if batch_func is not None:
+                batch = batch_func(batch)
+                continue
+            batch = ValuePointBatch.from_value_points(
+                self._modify_value_points(batch.to_value_points(), funcs))
+        return batch
+
+    def _modify_value_points(self, value_points, funcs):
+        """
+        Return the list of the value points modified by every function, the
+        ones a function returned nothing for are left out
+
+        Every value point goes through all the functions before the next one,
+        the only list built is the returned one: the file data consumers
+        (FilterManager, aggregators, 'last' matches) need a list, and batches
+        are built back from it.
+        """
+        modified_value_points = []
+        append = modified_value_points.append
+        for value_point in value_points:
+            for func in funcs:
+                value_point = func(value_point)
+                if value_point is None:
+                    break
+            else:
+                append(value_point)
+        return modified_value_points
+
+    def _get_batch_stages(self):
+        """
+        Return the (batch function, None) tuples of the modifiers having one
+        and the (None, functions) tuples of the consecutive modifiers having
+        none
+        """
+        batch_stages = []
+        funcs = []
+        for modifier in self._modifiers:
+            if modifier.get_batch_func() is None:
+                funcs.append(modifier.get_func())
+                continue
+            if len(funcs) != 0:
+                batch_stages.append((None, tuple(funcs)))
+                funcs = []
+            batch_stages.append((modifier.get_batch_func(), None))
+        if len(funcs) != 0:
+            batch_stages.append((None, tuple(funcs)))
+        return batch_stages
+
 
 class ModifierManager:
     """
@@ -49,15 +236,157 @@ class ModifierManager:
     def __init__(self):
         self._modifiers = []
         self._lookup_modules = [cluster_modifier, normalizer_modifier]
+        self._default_lookup_modules_count = len(self._lookup_modules)
+        self._loaded_columns = []
+        self._added_modifiers_count = 0
+        self._workers_count = 1
+        self._value_points_chunk_size = 1000
 
-    def add_modifier(self, func):
-        self._modifiers.append(Modifier(func))
+    def add_modifier(self, func, column=None):
+        self._modifiers.append(Modifier(func, column))
+        self._added_modifiers_count += 1
 
-    def run(self, data_generator):
-        current_generator = data_generator
+    def set_workers_count(self, workers_count):
+        """
+        Set the number of processes running the modifiers, 1 (the default)
+        runs them in the current process. Every worker process builds the
+        modifiers again from the lookup modules, which is only possible for
+        the modifiers loaded from columns.
+        """
+        self._workers_count = max(1, int(workers_count))
+
+    def get_input_fields(self):
+        """
+        Return the fields the modifiers read, None if a modifier does not
+        declare them
+        """
+        input_fields = []
+        for modifier in self._modifiers:
+            if modifier.get_input_fields() is None:
+                return None
+            input_fields += modifier.get_input_fields()
+        return input_fields
+
+    def get_modified_columns(self):
+        """
+        Return the columns computed or altered by the modifiers, None if a
+        modifier was added without telling which columns it computes
+        """
+        columns = []
+        for modifier in self._modifiers:
+            if modifier.get_output_fields() is None:
+                return None
+            columns += [column for column in modifier.get_output_fields()
+                        if column not in columns]
+        return columns
+
+    def can_push_down_filters(self):
+        """
+        Tell whether the filters not depending on the modified columns can be
+        applied while loading the data, before the modifiers run
+        """
         for modifier in self._modifiers:
-            current_generator = modifier.run(current_generator)
-        return current_generator
+            if not modifier.declares_effects():
+                return False
+        return True
+
+    def run(self, data_generator):
+        if len(self._modifiers) == 0:
+            return data_generator
+        if (self._workers_count > 1) & (self._added_modifiers_count == 0):
+            return self._run_in_parallel(data_generator)
+        return ModifierChain(self._modifiers).run(data_generator)
+
+    def get_specification(self):
+        """
+        Return what is needed to build the modifiers again (in another
+        process): the names of the lookup modules, the columns the modifiers
+        were loaded for and the resulting modifier columns
+        """
+        lookup_modules_names = [
+            module if isinstance(module, types.StringType) else module.__name__
+            for module
+            in self._lookup_modules[self._default_lookup_modules_count:]]
+        return {'lookup_modules': lookup_modules_names,
+                'loaded_columns': self._loaded_columns,
+                'columns': [modifier.get_column()
+                            for modifier in self._modifiers]}
+
+    @staticmethod
+    def from_specification(specification):
+        modifier_manager = ModifierManager()
+        for module_name in specification['lookup_modules']:
+            modifier_manager.add_lookup_module(module_name)
+        for columns in specification['loaded_columns']:
+            modifier_manager.load_modifiers_from_columns(columns)
+        columns = [modifier.get_column()
+                   for modifier in modifier_manager._modifiers]
+        if columns != specification['columns']:
+            raise Exception('The modifiers built again compute '
+                            + ', '.join(columns) + ' instead of '
+                            + ', '.join(specification['columns']))
+        return modifier_manager
+
+    def _run_in_parallel(self, data_generator):
+        """
+        Same as running the modifiers with a ModifierChain, the file data,
+        batches or chunks of value points are modified by the worker processes
+        and yielded in order
+        """
+        chain = ModifierChain(self._modifiers)
+        pool = multiprocessing.Pool(
+            self._workers_count, initializer=_init_worker,
+            initargs=(self.get_specification(),))
+        received_at_least_one = False
+        reached_index = -1
+        pending_results = collections.deque()
+        try:
+            # a last None task tells that every task was sent
+            for task in itertools.chain(self._get_tasks(data_generator),
+                                        [None]):
+                if task is not None:
+                    received_at_least_one = True
+                    pending_results.append(
+                        pool.apply_async(_run_worker_task, (task,)))
+                # only a few tasks are sent ahead, the data is not read faster
+                # than it is modified
+                while (len(pending_results) > 2 * self._workers_count) \
+                        or ((task is None) and (len(pending_results) != 0)):
+                    (kind, modified_data, task_reached_index) = \
+                        pending_results.popleft().get()
+                    reached_index = max(reached_index, task_reached_index)
+                    if kind == 'value_points':
+                        for value_point in modified_data:
+                            yield value_point
+                    else:
+                        yield modified_data
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        chain.check(received_at_least_one, reached_index)
+
+    def _get_tasks(self, data_generator):
+        """
+        Group the value points given one by one in chunks, generators are
+        turned into lists to be sent to the worker processes
+        """
+        value_points = []
+        for data in data_generator:
+            if isinstance(data, types.DictType):
+                value_points.append(data)
+                if len(value_points) >= self._value_points_chunk_size:
+                    yield ('value_points', value_points)
+                    value_points = []
+                continue
+            if len(value_points) != 0:
+                yield ('value_points', value_points)
+                value_points = []
+            if isinstance(data, types.GeneratorType):
+                data = [value_point for value_point in data]
+            yield ('data', data)
+        if len(value_points) != 0:
+            yield ('value_points', value_points)
 
     def add_lookup_module(self, module):
         if isinstance(module, types.StringType):
@@ -67,17 +396,48 @@ class ModifierManager:
         self._lookup_modules.append(module)
 
     def load_modifiers_from_columns(self, columns):
-        for modifier_func in self._get_modifiers_func_from_columns(columns):
-            self.add_modifier(modifier_func)
+        """
+        Add the modifiers computing the columns, along with the ones computing
+        the fields they read, in the order of their dependencies
+        """
+        self._loaded_columns.append(list(columns))
+        modifiers_map = self._get_modifiers_map(columns)
+        self._add_input_modifiers(modifiers_map)
+        for column in self._get_ordered_columns(modifiers_map):
+            self._modifiers.append(Modifier(modifiers_map[column], column))
+
+    def _add_input_modifiers(self, modifiers_map):
+        """
+        Add to the map the modifiers computing the input fields of its
+        modifiers, the fields no modifier computes are read from the data files
+        """
+        looked_up_fields = set(modifiers_map.keys())
+        input_fields = self._get_missing_input_fields(modifiers_map,
+                                                      looked_up_fields)
+        while len(input_fields) != 0:
+            looked_up_fields.update(input_fields)
+            input_modifiers_map = self._get_modifiers_map(input_fields)
+            modifiers_map.update(input_modifiers_map)
+            input_fields = self._get_missing_input_fields(input_modifiers_map,
+                                                          looked_up_fields)
 
-    def _get_modifiers_func_from_columns(self, columns):
+    def _get_missing_input_fields(self, modifiers_map, looked_up_fields):
+        input_fields = []
+        for modifier in modifiers_map.values():
+            for field in getattr(modifier, 'input_fields', None) or []:
+                if (field not in looked_up_fields) \
+                        and (field not in input_fields):
+                    input_fields.append(field)
+        return input_fields
+
+    def _get_modifiers_map(self, columns):
         modifiers_map = {}
 
         for modifier_module in self._lookup_modules:
             modifiers_map.update(
                 self._get_modifiers_map_from_module(columns, modifier_module))
 
-        return self._get_ordered_modifiers(modifiers_map)
+        return modifiers_map
 
     def _get_modifiers_map_from_module(self, columns, module):
         """
@@ -111,36 +471,101 @@ class ModifierManager:
                 imported_loader = getattr(imported_loader, sub_package)
         return imported_loader
 
-    def _get_ordered_modifiers(self, modifiers_map):
+    def _get_ordered_columns(self, modifiers_map):
         """
-        Return the modifier ordered in a such way that their computation won't
-        enter in any dependency problem.
+        Return the columns ordered in a such way that every modifier runs after
+        the ones computing the fields it reads (a topological order of their
+        dependency graph)
         """
-        modified_columns = modifiers_map.keys()
-        modified_columns_sorted = []
-        while len(modified_columns) != 0:
-            parent_columns = self._get_parent_columns(modified_columns)
-            modified_columns = list(set(modified_columns) - set(parent_columns))
-            modified_columns_sorted += parent_columns
-        modifiers = [modifiers_map[column] for column in modified_columns_sorted]
-        return modifiers
+        parent_columns = self._get_parent_columns(modifiers_map)
+        children_columns = {column: [] for column in modifiers_map}
+        for (column, parents) in parent_columns.items():
+            for parent_column in parents:
+                children_columns[parent_column].append(column)
+        remaining_parents_counts = {column: len(parents) for (column, parents)
+                                    in parent_columns.items()}
+        ready_columns = sorted(column for (column, count)
+                               in remaining_parents_counts.items()
+                               if count == 0)
+        ordered_columns = []
+        while len(ready_columns) != 0:
+            column = ready_columns.pop(0)
+            ordered_columns.append(column)
+            for child_column in children_columns[column]:
+                remaining_parents_counts[child_column] -= 1
+                if remaining_parents_counts[child_column] == 0:
+                    ready_columns.append(child_column)
+            ready_columns.sort()
+        if len(ordered_columns) != len(modifiers_map):
+            raise Exception('The modifiers of ' + ', '.join(sorted(
+                set(modifiers_map.keys()) - set(ordered_columns)))
+                + ' depend on each other')
+        return ordered_columns
 
-    def _get_parent_columns(self, columns):
+    def _get_parent_columns(self, modifiers_map):
         """
-        Get parent columns from a list of columns. A column is a parent one
-        if it's not contained in any other one. Among 'cluster_zone_4', 'zone'
-        and 'temperature', the parent columns are 'zone' and 'temperature',
-        implicitly we assume that 'cluster_zone_4' need 'zone' to be computed.
+        Return the columns whose modifiers have to run before the one of each
+        column: the ones computing its input fields. When they are not
+        declared, we assume that a column needs the columns it contains: among
+        'cluster_zone_4', 'zone' and 'temperature', 'cluster_zone_4' needs
+        'zone' to be computed.
         """
-        parent_columns = []
-        for column in columns:
-            found_parent = False
-            for parent_candidate_column in columns:
-                if column == parent_candidate_column:
-                    continue
-                if parent_candidate_column in column:
-                    found_parent = True
-                    break
-            if not found_parent:
-                parent_columns.append(column)
+        output_columns = {}
+        for (column, modifier) in modifiers_map.items():
+            for field in get_output_fields(modifier, column):
+                output_columns.setdefault(field, set()).add(column)
+        parent_columns = {}
+        for (column, modifier) in modifiers_map.items():
+            input_fields = getattr(modifier, 'input_fields', None)
+            if input_fields is None:
+                parents = set(parent_column for parent_column in modifiers_map
+                              if parent_column in column)
+            else:
+                parents = set(parent_column for field in input_fields
+                              for parent_column
+                              in output_columns.get(field, []))
+            parents.discard(column)  # a modifier may alter the fields it reads
+            parent_columns[column] = parents
         return parent_columns
+
+
+def get_output_fields(func, column=None):
+    """
+    Return the fields a modifier function computes, None when unknown
+    """
+    output_fields = getattr(func, 'output_fields', None)
+    if (output_fields is None) and (column is not None):
+        output_fields = [column]
+    return output_fields
+
+
+_worker_modifier_chain = None
+
+
+def _init_worker(specification):
+    """
+    Called once in every worker process, the modifiers are built again from
+    the lookup modules
+    """
+    global _worker_modifier_chain
+    # the forked coordinators hold the normalizers of the parent process, the
+    # normalizers built again would compute the same statistics next to them
+    normalizer_modifier._coordinators.clear()
+    modifier_manager = ModifierManager.from_specification(specification)
+    _worker_modifier_chain = ModifierChain(modifier_manager._modifiers)
+
+
+def _run_worker_task(task):
+    (kind, data) = task
+    try:
+        if kind == 'value_points':
+            (modified_data, reached_index) = \
+                _worker_modifier_chain.run_for_value_points(data)
+        else:
+            modified_data = _worker_modifier_chain.run_for_data(data)
+            reached_index = len(_worker_modifier_chain._modifiers)
+    except Exception:
+        # the traceback of the worker process would be lost otherwise
+        raise Exception('A modifier failed in a worker process:\n'
+                        + traceback.format_exc())
+    return (kind, modified_data, reached_index)
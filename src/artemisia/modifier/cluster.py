@@ -1,6 +1,9 @@
 import re
+import types
+import struct
 import pickle
 import hashlib
+import numpy
 
 cluster_pattern = re.compile('^cluster_(\d*)$')
 
@@ -13,10 +16,22 @@ def get_cluster_modifier(name):
     cluster_modulo = int(match.group(1))
 
     def cluster_modifier(value_point):
-        cluster_value = hash_as_int(value_point) % cluster_modulo
+        cluster_value = int(stable_hash(value_point) % cluster_modulo)
         field_name = 'cluster_' + str(cluster_modulo)
         value_point[field_name] = cluster_value
         return value_point
+
+    def cluster_batch_modifier(batch):
+        cluster_values = stable_hash_batch(batch) \
+            % numpy.uint64(cluster_modulo)
+        batch.set_column('cluster_' + str(cluster_modulo),
+                         cluster_values.astype(numpy.int64))
+        return batch
+
+    # the whole value point is hashed, input_fields can not be declared
+    cluster_modifier.batch_modifier = cluster_batch_modifier
+    cluster_modifier.output_fields = [name]
+    cluster_modifier.keeps_value_points = True
     return cluster_modifier
 
 
@@ -31,17 +46,192 @@ def get_cluster_from_field_modifier(name):
 
     cluster_field_name = match.group(1)
     cluster_modulo = int(match.group(2))
+    field_name = cluster_field_name + '_cluster_' + str(cluster_modulo)
+    # the hash is computed once per distinct value
+    cluster_values = {}
 
     def cluster_from_field_modifier(value_point):
-        cluster_value = hash_as_int(value_point[cluster_field_name]) \
-            % cluster_modulo
-        field_name = cluster_field_name + '_cluster_' + str(cluster_modulo)
+        value = value_point[cluster_field_name]
+        try:
+            cluster_value = cluster_values[value]
+        except KeyError:
+            cluster_value = int(stable_hash(value) % cluster_modulo)
+            if len(cluster_values) < memoized_values_count:
+                cluster_values[value] = cluster_value
+        except TypeError:
+            # unhashable values
+            cluster_value = int(stable_hash(value) % cluster_modulo)
         value_point[field_name] = cluster_value
         return value_point
+
+    def cluster_from_field_batch_modifier(batch):
+        cluster_values = stable_hash_column(
+            batch.get_column(cluster_field_name)) \
+            % numpy.uint64(cluster_modulo)
+        batch.set_column(field_name, cluster_values.astype(numpy.int64))
+        return batch
+
+    cluster_from_field_modifier.batch_modifier = \
+        cluster_from_field_batch_modifier
+    cluster_from_field_modifier.input_fields = [cluster_field_name]
+    cluster_from_field_modifier.output_fields = [field_name]
+    cluster_from_field_modifier.keeps_value_points = True
     return cluster_from_field_modifier
 
 
+memoized_values_count = 100000
+
+fnv_offset_basis = 0xcbf29ce484222325
+fnv_prime = 0x100000001b3
+uint64_mask = 0xffffffffffffffff
+# the first word of the numbers is their 'f' tag
+number_offset_basis = ((fnv_offset_basis ^ ord('f')) * fnv_prime) \
+    & uint64_mask
+float64_struct = struct.Struct('<d')
+uint64_struct = struct.Struct('<Q')
+
+# the hashes of the scalar values, memoized as the value points share them
+scalar_hashes = {}
+
+
+def stable_hash(value):
+    """
+    Return the 64 bits hash of a value, which (unlike hash()) is the same
+    across runs and processes: FNV-1a steps mix 64 bits words (the float64
+    bits of the numbers, so 1 and 1.0 are the same, the bytes of the strings,
+    the hashes of the fields and values of the value points, '_file_path' and
+    None values left aside), then the finalizer of MurmurHash3 spreads them
+    """
+    if isinstance(value, types.DictType):
+        hash_value = fnv_offset_basis
+        for field in sorted(value.keys()):
+            field_value = value[field]
+            if (field == '_file_path') or (field_value is None):
+                continue
+            hash_value = (((hash_value ^ _get_scalar_hash(field))
+                           * fnv_prime) & uint64_mask)
+            hash_value = (((hash_value ^ _get_scalar_hash(field_value))
+                           * fnv_prime) & uint64_mask)
+        return _finalize(hash_value)
+    return _hash_scalar(value)
+
+
+def stable_hash_column(column):
+    """
+    Return the stable_hash() of every value of a numpy array as an uint64
+    array, numbers are hashed at once
+    """
+    if column.dtype.kind in 'biuf':
+        prime = numpy.uint64(fnv_prime)
+        hashes = numpy.ascontiguousarray(column, dtype='<f8').view('<u8') \
+            ^ numpy.uint64(number_offset_basis)
+        return _finalize_column(hashes * prime)
+    values = column.tolist()
+    try:
+        # the hash is computed once per distinct value
+        distinct_hashes = {value: stable_hash(value) for value in set(values)}
+        hashes = [distinct_hashes[value] for value in values]
+    except TypeError:
+        # unhashable values
+        hashes = [stable_hash(value) for value in values]
+    return numpy.array(hashes, dtype=numpy.uint64)
+
+
+def stable_hash_batch(batch):
+    """
+    Return the stable_hash() of every value point of a ValuePointBatch as an
+    uint64 array, computed column by column
+    """
+    prime = numpy.uint64(fnv_prime)
+    hashes = numpy.empty(len(batch), dtype=numpy.uint64)
+    hashes[:] = fnv_offset_basis
+    for field in sorted(batch.get_fields()):
+        if field == '_file_path':
+            continue
+        column = batch.get_column(field)
+        field_hashes = (hashes ^ numpy.uint64(stable_hash(field))) * prime
+        field_hashes = (field_hashes ^ stable_hash_column(column)) * prime
+        if column.dtype == object:
+            # as in the value points, the missing values are left aside
+            is_defined = numpy.array([value is not None for value in column],
+                                     dtype=bool)
+            field_hashes = numpy.where(is_defined, field_hashes, hashes)
+        hashes = field_hashes
+    return _finalize_column(hashes)
+
+
+def _get_scalar_hash(value):
+    # the type is part of the key as 'a' == u'a' but their hashes differ
+    key = (type(value), value)
+    try:
+        hash_value = scalar_hashes.get(key)
+    except TypeError:
+        # unhashable values
+        return stable_hash(value)
+    if hash_value is None:
+        hash_value = _hash_scalar(value)
+        if len(scalar_hashes) < memoized_values_count:
+            scalar_hashes[key] = hash_value
+    return hash_value
+
+
+def _hash_scalar(value):
+    """
+    Mix the 64 bits words of a value: a tag telling its kind, then its
+    float64 bits or its length and bytes (padded to a multiple of 8)
+    """
+    if isinstance(value, types.StringType):
+        (tag, data) = ('s', value)
+    elif isinstance(value, (types.FloatType, types.IntType, types.LongType,
+                            numpy.number)):
+        try:
+            hash_value = number_offset_basis ^ uint64_struct.unpack(
+                float64_struct.pack(float(value)))[0]
+            return _finalize((hash_value * fnv_prime) & uint64_mask)
+        except OverflowError:
+            (tag, data) = ('p', pickle.dumps(value, 2))
+    elif isinstance(value, types.UnicodeType):
+        (tag, data) = ('u', value.encode('utf-8'))
+    elif value is None:
+        (tag, data) = ('n', '')
+    else:
+        (tag, data) = ('p', pickle.dumps(value, 2))
+    padding = '\0' * (-len(data) % 8)
+    words = struct.unpack('<%dQ' % ((len(data) + len(padding)) // 8),
+                          data + padding)
+    hash_value = ((fnv_offset_basis ^ ord(tag)) * fnv_prime) & uint64_mask
+    hash_value = ((hash_value ^ len(data)) * fnv_prime) & uint64_mask
+    for word in words:
+        hash_value = ((hash_value ^ word) * fnv_prime) & uint64_mask
+    return _finalize(hash_value)
+
+
+def _finalize(hash_value):
+    """
+    Spread every bit of the mixed words over the 64 bits (the finalizer of
+    MurmurHash3), so that the modulo of the hashes stays uniform
+    """
+    hash_value ^= hash_value >> 33
+    hash_value = (hash_value * 0xff51afd7ed558ccd) & uint64_mask
+    hash_value ^= hash_value >> 33
+    hash_value = (hash_value * 0xc4ceb9fe1a85ec53) & uint64_mask
+    return hash_value ^ (hash_value >> 33)
+
+
+def _finalize_column(hashes):
+    shift = numpy.uint64(33)
+    hashes ^= hashes >> shift
+    hashes *= numpy.uint64(0xff51afd7ed558ccd)
+    hashes ^= hashes >> shift
+    hashes *= numpy.uint64(0xc4ceb9fe1a85ec53)
+    return hashes ^ (hashes >> shift)
+
+
 def hash_as_int(input_value):
+    """
+    Return the MD5 of the pickled value as an int, the modifiers rely on
+    stable_hash() but this one is kept for the loader packages using it
+    """
     hash_input = pickle.dumps(input_value)
     md5 = hashlib.md5()
     md5.update(hash_input)
@@ -2,6 +2,13 @@ import os
 import pickle
 import hashlib
 import re
+import tempfile
+import numpy
+try:
+    import fcntl
+except ImportError:
+    # the normalization data is not locked where fcntl is not available
+    fcntl = None
 
 import artemisia.aggregator as gaggregator
 import artemisia.dataloader as gdataloader
@@ -10,6 +17,17 @@ import artemisia.registry as registry
 
 
 class Normalizer:
+    """
+    This class normalizes a field: its mean is removed and it is divided by
+    its standard deviation, both computed over the value points of the data
+    dir sharing the values of the fixed fields.
+
+    The statistics of every data file are persisted in the cache dir, keyed by
+    the data dir, the field and the fixed fields. The processes normalizing
+    the same field lock this data: a single one reads the data files while the
+    others wait and reuse its statistics.
+    """
+    _cache_dir_path = tempfile.gettempdir()
 
     def __init__(self, data_dir_path, field_to_normalize,
                  fixed_fields=None,
@@ -21,116 +39,431 @@ class Normalizer:
         self.filter_manager = gfilter.FilterManager()
 
         self._data_dir_path = data_dir_path
-        self._normalization_data_path_pattern = '/tmp/normalization-%s.data'
+        self._normalization_data_path_pattern = os.path.join(
+            Normalizer._cache_dir_path, 'normalization-%s.data')
         self._data_loader = gdataloader.DataLoader()
         self._normalization_data = None
+        self._files_statistics = None
+        self._groups = None
+        self._coordinator = None
+
+    @staticmethod
+    def set_cache_dir_path(cache_dir_path=None):
+        """
+        Set the directory where the normalization data is persisted, None
+        is the temporary directory
+        """
+        if cache_dir_path is None:
+            cache_dir_path = tempfile.gettempdir()
+        if not os.path.isdir(cache_dir_path):
+            os.makedirs(cache_dir_path)
+        Normalizer._cache_dir_path = cache_dir_path
 
     def normalize(self, value_point):
-        normalization_data = self._get_normalization_data()
+        (group_ids, means, stddevs) = self._get_groups()
 
-        value_point_key = self._get_value_point_key(value_point)
-        if value_point_key not in normalization_data.keys():
+        group_id = group_ids.get(self._get_value_point_key(value_point), None)
+        if group_id is None:
             raise Exception("Unknown problem type")
-        problem_normalization_data = normalization_data[value_point_key]
         # With heterogeneous data the field may not be available
-        if self._field_to_normalize not in value_point.keys():
+        if self._field_to_normalize not in value_point:
             return value_point
         normalized_value = value_point[self._field_to_normalize]
-
-        avg_key = 'AVG(' + self._field_to_normalize + ')'
-        normalized_value -= problem_normalization_data[avg_key]
-        stddev_key = 'STDDEV(' + self._field_to_normalize + ')'
-        normalized_value /= problem_normalization_data[stddev_key]
+        normalized_value -= means[group_id]
+        normalized_value /= stddevs[group_id]
         normalized_field = self._normalized_field_prefix \
             + self._field_to_normalize
         value_point[normalized_field] = normalized_value
         return value_point
 
+    def normalize_batch(self, batch):
+        """
+        Same as normalize() for a whole ValuePointBatch: the fixed fields keys
+        are built once per distinct combination of values, the column is then
+        normalized with the mean and the standard deviation arrays indexed by
+        group id
+        """
+        (group_ids, means, stddevs) = self._get_groups()
+        batch_group_ids = self._get_batch_group_ids(batch, group_ids)
+        if not batch.has_field(self._field_to_normalize):
+            return batch
+        column = batch.get_column(self._field_to_normalize)
+        present = None
+        if column.dtype == object:
+            present = numpy.array([value is not None
+                                   for value in column.tolist()], dtype=bool)
+            column = numpy.array(column[present].tolist(), dtype=float)
+            batch_group_ids = batch_group_ids[present]
+        batch_stddevs = numpy.array(stddevs)[batch_group_ids]
+        if (batch_stddevs == 0).any():
+            raise ZeroDivisionError('float division by zero')
+        normalized_values = (column - numpy.array(means)[batch_group_ids]) \
+            / batch_stddevs
+        if (present is not None) and not present.all():
+            # the value points without the field get no normalized value
+            normalized_column = numpy.repeat(None, len(batch))
+            normalized_column[present] = normalized_values.tolist()
+            normalized_values = normalized_column
+        batch.set_column(self._normalized_field_prefix
+                         + self._field_to_normalize, normalized_values)
+        return batch
+
+    def get_input_fields(self):
+        return [self._field_to_normalize] + self._fixed_fields
+
+    def set_coordinator(self, coordinator):
+        """
+        Let a NormalizationCoordinator compute the normalization data, along
+        with the one of the other normalizers of the data dir
+        """
+        self._coordinator = coordinator
+
+    def is_loaded(self):
+        return self._normalization_data is not None
+
+    def _get_groups(self):
+        """
+        Return the group id of every fixed fields key, along with the lists of
+        the means and standard deviations of the groups
+        """
+        if self._groups is not None:
+            return self._groups
+        normalization_data = self._get_normalization_data()
+        avg_key = 'AVG(' + self._field_to_normalize + ')'
+        stddev_key = 'STDDEV(' + self._field_to_normalize + ')'
+        group_ids = {}
+        means = []
+        stddevs = []
+        for (value_point_key, problem_normalization_data) \
+                in sorted(normalization_data.items()):
+            group_ids[value_point_key] = len(means)
+            means.append(problem_normalization_data[avg_key])
+            stddevs.append(problem_normalization_data[stddev_key])
+        self._groups = (group_ids, means, stddevs)
+        return self._groups
+
+    def _get_batch_group_ids(self, batch, group_ids):
+        """
+        Return the array of the group ids of the value points of a batch
+        """
+        combination_codes = numpy.zeros(len(batch), dtype=numpy.int64)
+        columns = []
+        for field in self._fixed_fields:
+            column = batch.get_column(field) if batch.has_field(field) \
+                else numpy.repeat(None, len(batch))
+            (codes, distinct_values_count) = _get_codes(column)
+            # renumbered after every field, the codes can not overflow
+            combination_codes = numpy.unique(
+                combination_codes * distinct_values_count + codes,
+                return_inverse=True)[1]
+            columns.append((field, column))
+        (first_indexes, combination_ids) = numpy.unique(
+            combination_codes, return_index=True, return_inverse=True)[1:]
+        combination_group_ids = numpy.empty(len(first_indexes),
+                                            dtype=numpy.int64)
+        for (combination_id, index) in enumerate(first_indexes.tolist()):
+            value_point = {field: column[index:index + 1].tolist()[0]
+                           for (field, column) in columns}
+            group_id = group_ids.get(self._get_value_point_key(value_point),
+                                     None)
+            if group_id is None:
+                raise Exception("Unknown problem type")
+            combination_group_ids[combination_id] = group_id
+        return combination_group_ids[combination_ids]
+
     def _get_value_point_key(self, value_point):
         key_elements = [field + '-->' + str(value_point[field])
                         for field in self._fixed_fields]
         key = '|'.join(key_elements)
         return key
 
-    def _get_data_hash(self):
-        file_names_generator = self._data_loader.list_data_files(
-            self._data_dir_path)
-        data_files = [f for f in file_names_generator]
-        data_files_string = ' '.join(data_files)
-        file_list_hash = hashlib.md5(data_files_string).hexdigest()
-        return file_list_hash
+    def _get_data_files_signatures(self):
+        """
+        Return the modification time and size of every data file, a file
+        whose signature changed has to be read again
+        """
+        return dict(self._data_loader.get_file_index(self._data_dir_path)
+                    .refresh())
 
     def _get_normalization_data(self):
+        """
+        Return the MIN, MAX, AVG and STDDEV of the field for every fixed
+        fields key
+        """
         if self._normalization_data is not None:
             return self._normalization_data
-        data = None
-        if os.path.exists(self._get_normalization_data_path()):
-            data = pickle.load(open(self._get_normalization_data_path()))
-            expected_hash = self._get_data_hash()
-            if expected_hash != data['hash']:
-                # hash do not match, data has changed since last computation
-                data = None
-        if data is None:
-            filtered_data = self._get_filtered_data()
-            files_hash = self._get_data_hash()
-            data = self._compute_normalization_data(filtered_data, files_hash)
-        self._normalization_data = data
-        self._persist_normalization_data()
-        return data
-
-    def _compute_normalization_data(self, filtered_data, files_hash):
-        aggregator = gaggregator.Aggregator()
+        if self._coordinator is not None:
+            self._coordinator.update()
+            return self._normalization_data
+        lock_files = _lock([self.get_lock_path()])
+        try:
+            files_statistics = self._load_files_statistics()
+            updated = self._update_files_statistics(files_statistics)
+            self._set_files_statistics(files_statistics, updated)
+        finally:
+            _unlock(lock_files)
+        return self._normalization_data
+
+    def get_lock_path(self):
+        return self._get_normalization_data_path() + '.lock'
+
+    def _load_files_statistics(self):
+        if not os.path.exists(self._get_normalization_data_path()):
+            return {}
+        stored_data = pickle.load(open(self._get_normalization_data_path()))
+        # data stored by older versions have no per file statistics
+        return stored_data.get('files', {})
+
+    def _set_files_statistics(self, files_statistics, updated):
+        self._files_statistics = files_statistics
+        self._normalization_data = \
+            self._compute_normalization_data(files_statistics)
+        if updated:
+            self._persist_normalization_data()
+
+    def _update_files_statistics(self, files_statistics):
+        """
+        Only the data files that are new or changed since the statistics have
+        been stored are read, return whether anything changed
+        """
+        signatures = self._get_data_files_signatures()
+        updated = self._remove_outdated_files_statistics(files_statistics,
+                                                         signatures)
+        for (file_path, signature) in signatures.items():
+            if file_path in files_statistics:
+                continue
+            filtered_data = self._get_filtered_data(file_path)
+            self._add_file_statistics(files_statistics, file_path, signature,
+                                      filtered_data)
+            updated = True
+        return updated
+
+    def _remove_outdated_files_statistics(self, files_statistics, signatures):
+        """
+        Remove the statistics of the data files removed or changed, return
+        whether there was any
+        """
+        removed = False
+        for file_path in files_statistics.keys():
+            if files_statistics[file_path]['signature'] \
+                    != signatures.get(file_path, None):
+                del files_statistics[file_path]
+                removed = True
+        return removed
+
+    def _add_file_statistics(self, files_statistics, file_path, signature,
+                             filtered_data):
+        files_statistics[file_path] = {
+            'signature': signature,
+            'statistics': self._compute_file_statistics(filtered_data)}
+
+    def _compute_file_statistics(self, filtered_data):
+        """
+        Return the mergeable statistics (count, sum, min, max, mean and sum of
+        squared deviations) of the field for each fixed fields key
+        """
+        aggregator = gaggregator.AggregatorFactory().get_aggregator()
         for field in self._fixed_fields:
             aggregator.add_aggregate_column(field)
-        relevant_values = ['MIN(' + self._field_to_normalize + ')',
-                           'MAX(' + self._field_to_normalize + ')',
+        relevant_values = ['COUNT(' + self._field_to_normalize + ')',
                            'AVG(' + self._field_to_normalize + ')',
+                           'MIN(' + self._field_to_normalize + ')',
+                           'MAX(' + self._field_to_normalize + ')',
                            'STDDEV(' + self._field_to_normalize + ')']
-        self._normalization_data = {'hash': files_hash}
-        data_pushed = False
-        for relevant_value in relevant_values:
-            aggregator.set_target_value(relevant_value)
-            if not data_pushed:
-                aggregated_data = aggregator.aggregate(filtered_data)
-                data_pushed = True
-            else:
-                aggregated_data = aggregator.aggregate()
-            self._enrich_normalization_data(relevant_value,
-                                            aggregated_data)
-        return self._normalization_data
+        # all the statistics are computed in a single pass
+        aggregator.set_target_values(relevant_values)
+        file_statistics = {}
+        for value_point in aggregator.aggregate(filtered_data):
+            (count, mean, minimum, maximum, stddev) = \
+                [value_point[relevant_value]
+                 for relevant_value in relevant_values]
+            if count == 0:
+                continue
+            value_point_key = self._get_value_point_key(value_point)
+            file_statistics[value_point_key] = \
+                (count, mean * count, minimum, maximum, mean,
+                 stddev * stddev * count)
+        return file_statistics
 
-    def _get_filtered_data(self):
-        raw = self._data_loader.extract_from_dir(self._data_dir_path)
+    def _compute_normalization_data(self, files_statistics):
+        """
+        Merge the statistics of every file
+        """
+        merged_statistics = {}
+        for file_statistics in files_statistics.values():
+            for (value_point_key, statistics) \
+                    in file_statistics['statistics'].items():
+                if value_point_key not in merged_statistics:
+                    merged_statistics[value_point_key] = \
+                        gaggregator.RunningStatistics()
+                merged_statistics[value_point_key].merge(*statistics)
+        normalization_data = {}
+        for (value_point_key, statistics) in merged_statistics.items():
+            normalization_data[value_point_key] = {
+                'MIN(' + self._field_to_normalize + ')': statistics.min,
+                'MAX(' + self._field_to_normalize + ')': statistics.max,
+                'AVG(' + self._field_to_normalize + ')': statistics.mean,
+                'STDDEV(' + self._field_to_normalize + ')':
+                    statistics.get_stddev()}
+        return normalization_data
 
-        filtered_data = self.filter_manager.filter(raw)
-        return filtered_data
+    def _get_filtered_data(self, file_path):
+        # with first to match filters, only the value points they may pick are
+        # read from the file
+        self._data_loader.set_first_to_match_filters(
+            self.filter_manager.get_selection_filters([]))
+        self._data_loader.set_projection(self.get_read_fields())
+        return self.filter_file_data(
+            self._data_loader.extract_from_file(file_path))
 
-    def _enrich_normalization_data(self,
-                                   relevant_value,
-                                   aggregated_data):
-        for value_point in aggregated_data:
-            value_point_key = self._get_value_point_key(value_point)
-            aggregate = value_point['aggregate']
-            if value_point_key not in self._normalization_data.keys():
-                self._normalization_data[value_point_key] = {}
-            self._normalization_data[value_point_key][relevant_value] =\
-                aggregate
+    def get_read_fields(self):
+        """
+        Return the fields of the data files the normalizer reads
+        """
+        return self.get_input_fields() + self.filter_manager.get_target_fields()
+
+    def filter_file_data(self, file_data):
+        return self.filter_manager.filter([file_data])
 
     def _persist_normalization_data(self):
-        if os.path.exists(self._get_normalization_data_path()):
-            os.remove(self._get_normalization_data_path())
-        pickle.dump(self._normalization_data,
-                    open(self._get_normalization_data_path(), 'wb'))
+        normalization_data_path = self._get_normalization_data_path()
+        # written aside and renamed, the worker processes running the
+        # modifiers may persist the same data at the same time
+        (handle, tmp_path) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(normalization_data_path)))
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump({'files': self._files_statistics}, f)
+        os.rename(tmp_path, normalization_data_path)
 
     def _get_normalization_data_path(self):
-        hash_input = self._field_to_normalize + '('\
-            + ','.join(self._fixed_fields) + ')'
+        hash_input = os.path.abspath(self._data_dir_path) + ':' \
+            + self._field_to_normalize + '(' + ','.join(self._fixed_fields) \
+            + ')'
         md5 = hashlib.md5()
         md5.update(hash_input)
         hash_value = md5.hexdigest()
         return self._normalization_data_path_pattern % hash_value
 
 
+class NormalizationCoordinator:
+    """
+    This class computes the normalization data of all the normalizers of a
+    data dir in a single scan: every data file some normalizer has no
+    statistics for is read once, with the fields all of them need, and its
+    value points are then filtered and aggregated by each normalizer.
+
+    The first normalizer needing its normalization data triggers the scan,
+    the normalizers of the requested columns are all built by then.
+    """
+
+    def __init__(self, data_dir_path):
+        self._data_dir_path = data_dir_path
+        self._data_loader = gdataloader.DataLoader()
+        self._normalizers = []
+
+    def add_normalizer(self, normalizer):
+        self._normalizers.append(normalizer)
+        normalizer.set_coordinator(self)
+
+    def update(self):
+        """
+        Compute the normalization data of the normalizers not having it yet
+        """
+        normalizers = [normalizer for normalizer in self._normalizers
+                       if not normalizer.is_loaded()]
+        # sorted, the processes lock the normalization data in the same order
+        lock_files = _lock(sorted(set(normalizer.get_lock_path()
+                                     for normalizer in normalizers)))
+        try:
+            self._update_normalizers(normalizers)
+        finally:
+            _unlock(lock_files)
+
+    def _update_normalizers(self, normalizers):
+        signatures = self._data_loader.get_file_index(self._data_dir_path) \
+            .refresh()
+        signatures_map = dict(signatures)
+        files_statistics = []
+        updated = []
+        for normalizer in normalizers:
+            normalizer_files_statistics = normalizer._load_files_statistics()
+            files_statistics.append(normalizer_files_statistics)
+            updated.append(normalizer._remove_outdated_files_statistics(
+                normalizer_files_statistics, signatures_map))
+        for (file_path, signature) in signatures:
+            indexes = [index for index in range(len(normalizers))
+                       if file_path not in files_statistics[index]]
+            if len(indexes) == 0:
+                continue
+            file_data = self._read_file(
+                file_path, [normalizers[index] for index in indexes])
+            for index in indexes:
+                normalizer = normalizers[index]
+                normalizer._add_file_statistics(
+                    files_statistics[index], file_path, signature,
+                    normalizer.filter_file_data(file_data))
+                updated[index] = True
+        for (index, normalizer) in enumerate(normalizers):
+            normalizer._set_files_statistics(files_statistics[index],
+                                             updated[index])
+
+    def _read_file(self, file_path, normalizers):
+        """
+        Return the value points of a data file with the fields the normalizers
+        read, only a single normalizer may restrict them to the ones its first
+        to match filters may pick
+        """
+        fields = []
+        for normalizer in normalizers:
+            fields += [field for field in normalizer.get_read_fields()
+                       if field not in fields]
+        selection_filters = None
+        if len(normalizers) == 1:
+            selection_filters = \
+                normalizers[0].filter_manager.get_selection_filters([])
+        self._data_loader.set_first_to_match_filters(selection_filters)
+        self._data_loader.set_projection(fields)
+        return [value_point for value_point
+                in self._data_loader.extract_from_file(file_path)]
+
+
+def _lock(lock_paths):
+    """
+    Take the exclusive locks of the lock files (waiting for the other
+    processes to release them), return the opened lock files
+    """
+    lock_files = []
+    if fcntl is None:
+        return lock_files
+    try:
+        for lock_path in lock_paths:
+            lock_file = open(lock_path, 'a')
+            lock_files.append(lock_file)
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    except:
+        _unlock(lock_files)
+        raise
+    return lock_files
+
+
+def _unlock(lock_files):
+    for lock_file in lock_files:
+        # closing the file releases the lock
+        lock_file.close()
+
+
+_coordinators = {}
+
+
+def get_coordinator(data_dir_path):
+    """
+    Return the NormalizationCoordinator shared by the normalizers of a data dir
+    """
+    if data_dir_path not in _coordinators:
+        _coordinators[data_dir_path] = NormalizationCoordinator(data_dir_path)
+    return _coordinators[data_dir_path]
+
+
 normalized_field_pattern = re.compile('^normalized_([\w\d_]*)$')
 
 
@@ -142,13 +475,34 @@ def get_normalized_field_modifier(name):
     field = match.group(1)
     data_dir_path = registry.instance.get_data_dir_path()
     normalizer = Normalizer(data_dir_path, field)
+    get_coordinator(data_dir_path).add_normalizer(normalizer)
 
     def normalized_field_modifier(value_point):
         value_point = normalizer.normalize(value_point)
         return value_point
 
+    normalized_field_modifier.input_fields = normalizer.get_input_fields()
+    normalized_field_modifier.batch_modifier = normalizer.normalize_batch
+    normalized_field_modifier.output_fields = [name]
+    normalized_field_modifier.keeps_value_points = True
+
     return normalized_field_modifier
 
+def _get_codes(column):
+    """
+    Return the code of the value of every value point (the index of the value
+    among the distinct values of the column) and the number of distinct values
+    """
+    if column.dtype != object:
+        (distinct_values, codes) = numpy.unique(column, return_inverse=True)
+        return (codes, len(distinct_values))
+    distinct_values = {}
+    codes = numpy.fromiter((distinct_values.setdefault(value,
+                                                       len(distinct_values))
+                            for value in column.tolist()),
+                           dtype=numpy.int64, count=len(column))
+    return (codes, len(distinct_values))
+
 modifiers_map = {
     normalized_field_pattern: get_normalized_field_modifier
 }
@@ -3,13 +3,19 @@ from filter_test import FilterTest
 from aggregator_test import AggregatorTest
 from modifier_test import ModifierTest
 from arff_exporter_test import ArffExporterTest
+from dataloader_test import DataLoaderTest
+from normalizer_test import NormalizerTest
+from columnar_exporter_test import ColumnarExporterTest
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     test_cases = [FilterTest,
                   AggregatorTest,
                   ModifierTest,
-                  ArffExporterTest]
+                  ArffExporterTest,
+                  DataLoaderTest,
+                  NormalizerTest,
+                  ColumnarExporterTest]
     for case in test_cases:
         suite.addTests(unittest.makeSuite(case))
     unittest.TextTestRunner().run(suite)
\ No newline at end of file
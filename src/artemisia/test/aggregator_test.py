@@ -1,5 +1,7 @@
 import unittest
 import artemisia.aggregator as aggregator
+import artemisia.helper as ahelper
+from artemisia.batch import ValuePointBatch
 
 
 class AggregatorTest(unittest.TestCase):
@@ -35,6 +37,62 @@ class AggregatorTest(unittest.TestCase):
         self.assertEqual(12.4, aggregated_matrix['book']['red'])
         self.assertEqual(0.79, aggregated_matrix['it']['red'])
 
+    def test_batch_avg(self):
+        agg = aggregator.Aggregator()
+        agg.set_target_value('AVG(price)')
+        agg.add_aggregate_column('seller')
+        expected = [value for value in agg.aggregate(self._get_test_data())]
+
+        helper = ahelper.Helper()
+        value_points = [value for value
+                        in helper.flatten(self._get_test_data())]
+        batch = ValuePointBatch.from_value_points(value_points)
+        self.assertEqual(expected, [value for value in agg.aggregate([batch])])
+
+    def test_in_memory_backends(self):
+        factory = aggregator.AggregatorFactory()
+        target_values = ['COUNT(*)', 'COUNT(price)', 'AVG(price)',
+                         'MIN(price)', 'MAX(price)', 'SUM(price)',
+                         'STDDEV(price)']
+        batch = ValuePointBatch.from_value_points(
+            [value for value in ahelper.Helper().flatten(
+                self._get_test_data())])
+        for (backend, target_value, test_data) in \
+                [(backend, target_value, test_data)
+                 for backend in ['numpy', 'streaming']
+                 for target_value in target_values
+                 for test_data in [self._get_test_data(), [batch]]]:
+            expected_agg = factory.get_aggregator('sqlite')
+            tested_agg = factory.get_aggregator(backend)
+            for agg in [expected_agg, tested_agg]:
+                agg.set_target_value(target_value)
+                agg.add_aggregate_column('category')
+                agg.add_aggregate_column('color')
+            expected = [value for value
+                        in expected_agg.aggregate(self._get_test_data())]
+            aggregated = [value for value in tested_agg.aggregate(test_data)]
+            self.assertEqual(len(expected), len(aggregated))
+            for (expected_value, value) in zip(expected, aggregated):
+                self.assertEqual(expected_value['category'], value['category'])
+                self.assertEqual(expected_value['color'], value['color'])
+                self.assertAlmostEqual(expected_value['aggregate'],
+                                       value['aggregate'])
+
+    def test_multiple_target_values(self):
+        for backend in ['sqlite', 'numpy', 'streaming']:
+            agg = aggregator.AggregatorFactory().get_aggregator(backend)
+            agg.add_aggregate_column('seller')
+            agg.set_target_values(['MIN(price)', 'MAX(price)',
+                                   'STDDEV(price)', 'COUNT(*)'])
+            per_seller = {value['seller']: value
+                          for value in agg.aggregate(self._get_test_data())}
+            apple = per_seller['apple']
+            self.assertEqual(0.79, apple['MIN(price)'])
+            self.assertEqual(0.79, apple['aggregate'])
+            self.assertEqual(559, apple['MAX(price)'])
+            self.assertAlmostEqual(279.105, apple['STDDEV(price)'])
+            self.assertEqual(5, per_seller['amazon']['COUNT(*)'])
+
     def _get_test_data(self):
         return [
             {'seller': 'amazon', 'category': 'book', 'color': 'blue',
@@ -28,6 +28,24 @@ class ArffExporterTest(unittest.TestCase):
         self.assertTrue('@ATTRIBUTE weight numeric' in output)
         self.assertTrue('@ATTRIBUTE width numeric' not in output)
 
+    def test_streamed_export(self):
+        exporter = ArffExporter()
+        exporter.set_columns(['problem', 'iteration'])
+        exporter._arff_max_fetched_values = 3
+
+        def get_file_data():
+            for iteration in range(1000):
+                yield {'problem': 'problem_%d' % (iteration % 2),
+                       'iteration': iteration}
+        exporter.export(get_file_data())
+        lines = exporter.get_output().split("\n")
+        self.assertTrue('@ATTRIBUTE problem {problem_0,problem_1}' in lines)
+        self.assertTrue('@ATTRIBUTE iteration numeric' in lines)
+        self.assertEqual(3, len(exporter._arff_fetched_values['iteration']))
+        data_lines = lines[lines.index('@DATA') + 2:]
+        self.assertEqual(1000, len(data_lines))
+        self.assertTrue(data_lines[999] in ['problem_1,999', '999,problem_1'])
+
     def _get_fake_file_data(self):
         file_data = [{'problem': 'tsp_solution',
                       'width': 150,
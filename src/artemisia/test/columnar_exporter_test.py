@@ -0,0 +1,89 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+
+from artemisia.exporter import ExporterFactory
+from artemisia.exporter.npz_exporter import NpzExporter
+import artemisia.exporter.arrow_exporter as aarrow_exporter
+
+
+class ColumnarExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir_path)
+
+    def test_npz_export(self):
+        file_path = os.path.join(self._dir_path, 'export.npz')
+        self._export('npz', file_path,
+                     ['problem', 'iteration', 'weight', 'label'])
+        # one array per column and chunk of 2 value points
+        data = numpy.load(file_path, allow_pickle=True)
+        self.assertEqual(3, int(data['chunks']))
+        self.assertEqual([213, 250], data['column_1_0'].tolist())
+        data.close()
+
+        batch = NpzExporter.load(file_path)
+        self.assertEqual(['problem', 'iteration', 'weight', 'label'],
+                         batch.get_fields())
+        self.assertEqual(5, len(batch))
+        self.assertEqual(['tsp_solution'] * 3 + ['other_solution'] * 2,
+                         batch.get_column('problem').tolist())
+        self.assertEqual(batch.get_column('problem').dtype.kind, 'S')
+        self.assertEqual([213, 250, 213, 250, 300],
+                         batch.get_column('iteration').tolist())
+        self.assertEqual(batch.get_column('iteration').dtype, numpy.int64)
+        # a float in the last chunk makes the column a float column
+        self.assertEqual([-15.0, 14.0, -15.0, 11.0, 0.5],
+                         batch.get_column('weight').tolist())
+        # numbers, then strings, are kept in an object array
+        self.assertEqual([1, 2, 3, 'four', 'five'],
+                         batch.get_column('label').tolist())
+
+    @unittest.skipIf(aarrow_exporter.pyarrow is None,
+                     'pyarrow is not available')
+    def test_arrow_export(self):
+        import pyarrow
+        import pyarrow.parquet
+        file_path = os.path.join(self._dir_path, 'export.parquet')
+        self._export('parquet', file_path, ['problem', 'iteration'])
+        parquet_file = pyarrow.parquet.ParquetFile(file_path)
+        self.assertEqual(3, parquet_file.num_row_groups)
+        table = parquet_file.read()
+        self.assertEqual([213, 250, 213, 250, 300],
+                         table.column('iteration').to_pylist())
+
+        file_path = os.path.join(self._dir_path, 'export.feather')
+        self._export('feather', file_path, ['problem', 'iteration'])
+        table = pyarrow.ipc.open_file(pyarrow.OSFile(file_path)).read_all()
+        self.assertEqual(['tsp_solution'] * 3 + ['other_solution'] * 2,
+                         table.column('problem').to_pylist())
+
+    def _export(self, export_type, file_path, columns):
+        exporter = ExporterFactory().get_exporter_factory(export_type)
+        exporter._row_group_size = 2
+        exporter.set_columns(columns)
+        exporter.set_output_file_path(file_path)
+        exporter.export(self._get_fake_file_data())
+        exporter.get_file_handle().close()
+
+    def _get_fake_file_data(self):
+        file_data = [{'problem': 'tsp_solution', 'iteration': 213,
+                      'weight': -15, 'label': 1},
+                     {'problem': 'tsp_solution', 'iteration': 250,
+                      'weight': 14, 'label': 2},
+                     {'problem': 'tsp_solution', 'iteration': 213,
+                      'weight': -15, 'label': 3},
+                     {'problem': 'other_solution', 'iteration': 250,
+                      'weight': 11, 'label': 'four'},
+                     {'problem': 'other_solution', 'iteration': 300,
+                      'weight': 0.5, 'label': 'five'}]
+        return [file_data]
+
+
+if __name__ == '__main__':
+    unittest.main()
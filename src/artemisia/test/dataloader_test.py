@@ -0,0 +1,362 @@
+import unittest
+import tempfile
+import shutil
+import os
+
+from artemisia.dataloader import DataLoader
+from artemisia.dataloader.column_store import ColumnStore
+from artemisia.dataloader.schema import Schema
+from artemisia.filter import FilterManager
+
+
+class DataLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir_path = tempfile.mkdtemp()
+        for i in range(6):
+            file_path = os.path.join(self._dir_path, 'data%d.csv' % i)
+            with open(file_path, 'w') as f:
+                f.write("temperature,room\n")
+                f.write("%d,bedroom\n" % i)
+                f.write("%d.5,kitchen\n" % i)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir_path)
+        DataLoader.set_discovery()
+
+    def test_extract_from_dir(self):
+        loader = DataLoader()
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(6, len(files_data))
+        for file_data in files_data:
+            self.assertEqual(2, len(file_data))
+            self.assertEqual('bedroom', file_data[0]['room'])
+            self.assertTrue(isinstance(file_data[1]['temperature'], float))
+
+    def test_extract_from_dir_in_parallel(self):
+        loader = DataLoader()
+        expected = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+
+        loader.set_workers_count(3)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(expected, files_data)
+
+        loader.set_preserve_order(False)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(sorted(expected), sorted(files_data))
+
+    def test_extract_batch_from_dir(self):
+        loader = DataLoader()
+        expected = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+
+        loader.set_batch_mode(True)
+        batches = [batch for batch in loader.extract_from_dir(self._dir_path)]
+        self.assertEqual(expected, self._generator_to_lists(batches))
+        temperature = batches[0].get_column('temperature')
+        self.assertEqual(float, temperature.dtype)
+
+    def test_cache(self):
+        loader = DataLoader()
+        expected = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+
+        cache_dir_path = os.path.join(self._dir_path, 'cache')
+        loader.set_cache_dir_path(cache_dir_path)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(expected, files_data)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(expected, files_data)
+        statistics = loader.get_cache().get_statistics()
+        self.assertEqual(6, statistics['entries'])
+        self.assertEqual(6, statistics['hits'])
+        self.assertEqual(6, statistics['misses'])
+
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'a') as f:
+            f.write("12,living\n")
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        file_data = [file_data for file_data in files_data
+                     if file_data[0]['_file_path'] == file_path][0]
+        self.assertEqual(3, len(file_data))
+        self.assertEqual(7, loader.get_cache().get_statistics()['misses'])
+
+        # entries are not shared across parsers and schemas
+        signature = loader._get_casts_signature()
+        loader.set_schema(Schema({'temperature': 'str'}))
+        self.assertNotEqual(signature, loader._get_casts_signature())
+        loader.set_schema(None)
+        loader.set_parser('pandas')
+        self.assertNotEqual(signature, loader._get_casts_signature())
+
+        self.assertEqual(7, loader.get_cache().clear())
+
+    def test_filter_manager(self):
+        loader = DataLoader()
+        expected = [[value_point for value_point in file_data
+                     if (value_point['temperature'] >= 2)
+                     and (value_point['room'] == 'kitchen')]
+                    for file_data
+                    in self._generator_to_lists(
+                        loader.extract_from_dir(self._dir_path))]
+
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter(
+            'temperature >= 2 and room = kitchen')
+        filter_manager.add_file_data_filter('cluster_room_2 = 0')
+        pushed_down = filter_manager.push_down(['cluster_room_2'])
+        self.assertEqual(['temperature', 'room'],
+                         pushed_down.get_target_fields())
+        self.assertEqual(['cluster_room_2', 'room', 'temperature'],
+                         sorted(filter_manager.get_target_fields()))
+        loader.set_filter_manager(pushed_down)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual(expected, files_data)
+        # empty batches are skipped
+        loader.set_batch_mode(True)
+        files_data = self._generator_to_lists(
+            loader.extract_from_dir(self._dir_path))
+        self.assertEqual([file_data for file_data in expected
+                          if len(file_data) != 0], files_data)
+
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter('room = bedroom')
+        self.assertEqual(None, filter_manager.push_down(None))
+        loader.set_filter_manager(filter_manager, True)
+        for batch_mode in [False, True]:
+            loader.set_batch_mode(batch_mode)
+            self.assertEqual([], self._generator_to_lists(
+                loader.extract_from_dir(self._dir_path)))
+
+    def test_first_to_match_filters(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'a') as f:
+            f.write("3,living\r\n12,\"hall, north\"\r\n\r\n")
+        loader = DataLoader()
+        self.assertEqual(['12', 'hall, north'],
+                         loader._read_last_row(file_path))
+
+        filter_manager = FilterManager()
+        filter_manager.add_first_to_match_filter('room = kitchen')
+        loader.set_first_to_match_filters(
+            filter_manager.get_selection_filters([]))
+        value_points = [value_point for value_point
+                        in loader.extract_from_file(file_path)]
+        self.assertEqual(['kitchen', 'hall, north'],
+                         [value_point['room'] for value_point in value_points])
+        self.assertEqual(0.5, value_points[0]['temperature'])
+
+        filter_manager = FilterManager()
+        filter_manager.add_first_to_match_filter('room = nowhere')
+        filter_manager.add_first_to_match_filter('last')
+        self.assertEqual(None, filter_manager.get_selection_filters(['room']))
+        loader.set_first_to_match_filters(
+            filter_manager.get_selection_filters([]))
+        loader.set_batch_mode(True)
+        batch = loader.extract_batch_from_file(file_path)
+        self.assertEqual(['bedroom', 'hall, north'],
+                         batch.get_column('room').tolist())
+        self.assertEqual([batch[-1]],
+                         [value_point for value_point
+                          in filter_manager.filter([batch])])
+
+    def test_projection(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'w') as f:
+            f.write("temperature,room,time\n")
+            f.write("12,bedroom,1\n")
+            f.write("13,kitchen,2\n")
+        loader = DataLoader()
+        loader.set_projection(['room'])
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter('|time| > 1')
+        loader.set_filter_manager(filter_manager)
+        expected = [{'room': 'kitchen', 'time': 2, '_file_path': file_path}]
+        self.assertEqual(expected, [value_point for value_point
+                                    in loader.extract_from_file(file_path)])
+        loader.set_batch_mode(True)
+        self.assertEqual(expected,
+                         loader.extract_batch_from_file(file_path)
+                         .to_value_points())
+        loader.set_cache_dir_path(os.path.join(self._dir_path, 'cache'))
+        for i in range(2):
+            self.assertEqual(expected,
+                             loader.extract_batch_from_file(file_path)
+                             .to_value_points())
+
+    def test_schema(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'a') as f:
+            f.write("n/a,12\n")
+        loader = DataLoader()
+        loader._schema_sample_rows_count = 2
+        schema = loader.infer_schema(self._dir_path)
+        self.assertEqual({'temperature': 'float', 'room': 'str'},
+                         schema.get_types())
+
+        schema_path = os.path.join(self._dir_path, 'schema.json')
+        schema.save(schema_path)
+        self.assertEqual(schema.get_types(),
+                         Schema.load(schema_path).get_types())
+
+        # values not following the schema are still casted when possible
+        expected = [{'temperature': 0.0, 'room': 'bedroom'},
+                    {'temperature': 0.5, 'room': 'kitchen'},
+                    {'temperature': 'n/a', 'room': 12.0}]
+        for batch_mode in [False, True]:
+            loader = DataLoader()
+            loader.set_schema(Schema.load(schema_path))
+            loader.set_batch_mode(batch_mode)
+            value_points = [value_point for value_point
+                            in loader.extract_from_file(file_path)]
+            if batch_mode:
+                value_points = loader.extract_batch_from_file(file_path) \
+                    .to_value_points()
+            for value_point in value_points:
+                del value_point['_file_path']
+            self.assertEqual(expected, value_points)
+
+    def test_pandas_parser(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'w') as f:
+            f.write("temperature,room,heated,time\n")
+            f.write("12,bedroom,True,1\n")
+            f.write("n/a,kitchen,False,2\n")
+            f.write("13.5,14,True,\n")
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter('time > 1')
+        for batch_mode in [False, True]:
+            loader = DataLoader()
+            loader.set_batch_mode(batch_mode)
+            expected = self._generator_to_lists(
+                loader.extract_from_dir(self._dir_path))
+            loader.set_parser('pandas')
+            self.assertEqual(expected, self._generator_to_lists(
+                loader.extract_from_dir(self._dir_path)))
+
+            loader.set_filter_manager(filter_manager)
+            loader.set_projection(['room'])
+            self.assertEqual([{'room': 'kitchen', 'time': 2.0,
+                               '_file_path': file_path}],
+                             [value_point for value_point
+                              in loader.extract_from_file(file_path)])
+        self.assertRaises(Exception, DataLoader().set_parser, 'fortran')
+
+    def test_byte_ranges(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'a') as f:
+            for i in range(20):
+                f.write("%d,room%d\n" % (i, i % 3))
+        loader = DataLoader()
+        byte_ranges = loader.get_byte_ranges(file_path, 4)
+        self.assertEqual(4, len(byte_ranges))
+        with open(file_path) as f:
+            content = f.read()
+        self.assertEqual(content[content.index('\n') + 1:],
+                         ''.join(content[start:end]
+                                 for (start, end) in byte_ranges))
+
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter('room = room1')
+        for batch_mode in [False, True]:
+            loader = DataLoader()
+            loader.set_batch_mode(batch_mode)
+            loader.set_filter_manager(filter_manager)
+            expected = self._extract_value_points(loader, file_path)
+            loader.set_workers_count(2)
+            loader._split_min_size = 0
+            self.assertEqual(expected,
+                             self._extract_value_points(loader, file_path))
+
+    def test_column_store(self):
+        file_path = os.path.join(self._dir_path, 'data0.csv')
+        with open(file_path, 'a') as f:
+            f.write("n/a,hall\n3,living\n")
+        loader = DataLoader()
+        loader.set_batch_mode(True)
+        store_path = os.path.join(self._dir_path, 'data0.columns')
+        ColumnStore.write(store_path, loader.extract_batch_from_file(file_path))
+        self.assertTrue(store_path in loader.list_data_files(self._dir_path))
+        store = ColumnStore(store_path)
+        self.assertEqual(4, len(store))
+        self.assertEqual({'temperature': 3.0, 'room': 'living'},
+                         store.get_value_point(-1))
+
+        filter_manager = FilterManager()
+        filter_manager.add_first_to_match_filter('room = hall')
+        for batch_mode in [False, True]:
+            loader = DataLoader()
+            loader.set_batch_mode(batch_mode)
+            expected = [value_point for value_point
+                        in loader.extract_from_file(file_path)]
+            value_points = [value_point for value_point
+                            in loader.extract_from_file(store_path)]
+            for value_point in value_points:
+                value_point['_file_path'] = file_path
+            self.assertEqual(expected, value_points)
+
+            loader._column_store_chunk_size = 2
+            loader.set_first_to_match_filters(
+                filter_manager.get_selection_filters([]))
+            self.assertEqual(['hall', 'living'],
+                             [value_point['room'] for value_point
+                              in loader.extract_from_file(store_path)])
+
+    def test_discovery(self):
+        for (dir_name, file_name) in [('2016', 'run.csv'), ('2016', 'run.txt'),
+                                      ('2017/tmp', 'run.csv')]:
+            dir_path = os.path.join(self._dir_path, dir_name)
+            if not os.path.isdir(dir_path):
+                os.makedirs(dir_path)
+            with open(os.path.join(dir_path, file_name), 'w') as f:
+                f.write("temperature,room\n12,bedroom\n")
+        loader = DataLoader()
+        self.assertEqual(6, len(loader.list_data_files(self._dir_path)))
+
+        index_path = os.path.join(self._dir_path, 'index')
+        DataLoader.set_discovery(True, ['*.csv'], ['*/tmp'], index_path)
+        expected = sorted([os.path.join(self._dir_path, 'data%d.csv' % i)
+                           for i in range(6)]
+                          + [os.path.join(self._dir_path, '2016/run.csv')])
+        self.assertEqual(expected, sorted(loader.list_data_files(
+            self._dir_path)))
+        self.assertTrue(os.path.exists(index_path))
+
+        # the persisted listings are reused, only the changed directories are
+        # listed again
+        DataLoader.set_discovery(True, ['*.csv'], ['*/tmp'], index_path)
+        file_index = loader.get_file_index(self._dir_path)
+        listed_dir_paths = []
+        list_directory = file_index._list_directory
+
+        def recording_list_directory(relative_dir_path):
+            listed_dir_paths.append(relative_dir_path)
+            return list_directory(relative_dir_path)
+        file_index._list_directory = recording_list_directory
+        file_index._racy_delay = -1
+        os.remove(os.path.join(self._dir_path, 'data5.csv'))
+        self.assertEqual(expected[:-1], sorted(loader.list_data_files(
+            self._dir_path)))
+        self.assertEqual([''], listed_dir_paths)
+
+    def _extract_value_points(self, loader, file_path):
+        data = [data for data in loader.extract_from_path(file_path)]
+        if loader._batch_mode:
+            return data[0].to_value_points()
+        return data
+
+    def _generator_to_lists(self, generator):
+        return [[value_point for value_point in file_data]
+                for file_data in generator]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,4 +4,30 @@ def get_size_modifier():
     def size_modifier(value_point):
         value_point['size'] = 12
         return value_point
-    return size_modifier
\ No newline at end of file
+    return size_modifier
+
+def get_area_modifier():
+    def area_modifier(value_point):
+        value_point['area'] = value_point['size'] * value_point['width']
+        value_point['half_area'] = value_point['area'] / 2.0
+        return value_point
+    area_modifier.input_fields = ['size', 'width']
+    area_modifier.output_fields = ['area', 'half_area']
+    return area_modifier
+
+def get_odd_iteration_modifier():
+    def odd_iteration_modifier(value_point):
+        if value_point['iteration'] % 2 == 1:
+            value_point['odd_iteration'] = True
+            return value_point
+    return odd_iteration_modifier
+
+def get_dropped_modifier():
+    def dropped_modifier(value_point):
+        return None
+    return dropped_modifier
+
+def get_failing_modifier():
+    def failing_modifier(value_point):
+        raise ValueError('failing_modifier always fails')
+    return failing_modifier
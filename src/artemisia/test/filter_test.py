@@ -2,6 +2,8 @@ import unittest
 
 from artemisia.filter import FilterManager
 from artemisia.filter.FieldFilter import FieldFilter
+from artemisia.filter.expression import FilterExpression
+from artemisia.batch import ValuePointBatch
 
 
 class FilterTest(unittest.TestCase):
@@ -47,6 +49,70 @@ class FilterTest(unittest.TestCase):
         filtered = self._generator_to_list(filter_manager.filter([file_data]))
         self.assertEqual(filtered, [])
 
+    def test_filter_manager_batch(self):
+        file_data = self._get_fake_file_data()
+        batch = ValuePointBatch.from_value_points(file_data)
+
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter('problem', 'solution')
+        filter_manager.add_file_data_filter('iteration', '>', 220)
+
+        filtered = self._generator_to_list(filter_manager.filter([batch]))
+        self.assertEqual(1, len(filtered))
+        self.assertEqual([file_data[-1]], filtered[0].to_value_points())
+
+        filter_manager = FilterManager()
+        filter_manager.add_first_to_match_filter('|weight|', '>', 12)
+        filtered = self._generator_to_list(filter_manager.filter([batch]))
+        self.assertEqual([file_data[0]], filtered)
+
+        # a missing field matches as a None value
+        for field_filter in [FieldFilter('missing', 'not', 'in', 'x'),
+                             FieldFilter('missing', '=', 'x')]:
+            self.assertEqual([field_filter.match(value_point)
+                              for value_point in file_data],
+                             field_filter.match_batch(batch).tolist())
+
+    def test_filter_expression(self):
+        file_data = self._get_fake_file_data()
+        batch = ValuePointBatch.from_value_points(file_data)
+
+        cases = [('problem solution', [True, True]),
+                 ('width > 100 and iteration < 250', [True, False]),
+                 ('iteration = 1 or |weight| >= 15', [True, False]),
+                 ('not (iteration in 213 300)', [False, True]),
+                 ('problem not in (tsp_solution, other)', [False, False]),
+                 ("problem = 'TSP_solution' AND NOT weight > 0",
+                  [True, False]),
+                 ('missing = 1 or missing != 1', [False, False])]
+        for (expression_string, expected) in cases:
+            expression = FilterExpression(expression_string)
+            self.assertEqual(expected, [expression.match(value_point)
+                                        for value_point in file_data],
+                             expression_string)
+            self.assertEqual(expected, expression.match_batch(batch).tolist(),
+                             expression_string)
+
+        expression = FilterExpression('|weight| > 1 and (width = 1 or w = 2)')
+        self.assertEqual(['weight', 'width', 'w'],
+                         expression.get_target_fields())
+
+        for expression_string in ['width >', 'width > 1 and', '(width > 1',
+                                  'width in']:
+            self.assertRaises(Exception, FilterExpression, expression_string)
+
+    def test_filter_manager_expression(self):
+        file_data = self._get_fake_file_data()
+
+        filter_manager = FilterManager()
+        filter_manager.add_file_data_filter(
+            '(problem = other or width >= 150) and weight < 0')
+        filter_manager.add_file_data_filter('(iteration,<,300)')
+        filtered = self._generator_to_list(filter_manager.filter([file_data]))
+        self.assertEqual([file_data[0]], filtered)
+        self.assertEqual(['problem', 'width', 'weight', 'iteration'],
+                         filter_manager.get_target_fields())
+
     def _get_fake_file_data(self):
         file_data = [{'problem': 'tsp_solution',
                       'width': 150,
@@ -1,7 +1,11 @@
 import unittest
 
 from artemisia.modifier import ModifierManager
+import artemisia.modifier as amodifier
+import artemisia.modifier.normalizer as normalizer
 import artemisia.modifier.cluster as acluster
+from artemisia.test import dummy_package
+from artemisia.batch import ValuePointBatch
 
 
 class ModifierTest(unittest.TestCase):
@@ -19,11 +23,188 @@ class ModifierTest(unittest.TestCase):
         modified_file_generator = modifier_manager.run(file_data)
         for value_point in modified_file_generator:
             width_cluster = value_point['width_cluster_2']
-            self.assertEqual(0, width_cluster, 'This one cluster should be 0')
+            self.assertEqual(1, width_cluster, 'This one cluster should be 1')
 
             size = value_point['size']
             self.assertEqual(12, size, 'Size is hardcoded to 12')
 
+    def test_modifier_manager_batch(self):
+        file_data = self._get_fake_file_data()
+
+        modifier_manager = ModifierManager()
+        modifier_manager.add_lookup_module('artemisia.test.dummy_package')
+        modifier_manager.add_lookup_module(acluster)
+        modifier_manager.load_modifiers_from_columns(['width_cluster_2',
+                                                      'cluster_3', 'size'])
+        expected = [value_point for value_point
+                    in modifier_manager.run([self._get_fake_file_data()])]
+
+        batch = ValuePointBatch.from_value_points(file_data)
+        modified = [modified_batch for modified_batch
+                    in modifier_manager.run([batch])]
+        self.assertEqual(expected, [modified[0].to_value_points()])
+
+    def test_input_fields(self):
+        modifier_manager = ModifierManager()
+        modifier_manager.add_lookup_module(acluster)
+        modifier_manager.load_modifiers_from_columns(['width_cluster_2'])
+        self.assertEqual(['width'], modifier_manager.get_input_fields())
+        self.assertEqual(['width_cluster_2'],
+                         modifier_manager.get_modified_columns())
+
+        modifier_manager.load_modifiers_from_columns(['cluster_3'])
+        self.assertEqual(None, modifier_manager.get_input_fields())
+
+    def test_dependency_graph(self):
+        modifier_manager = ModifierManager()
+        modifier_manager.add_lookup_module('artemisia.test.dummy_package')
+        modifier_manager.add_lookup_module(acluster)
+        # the size modifier computes an input field of the area modifier
+        modifier_manager.load_modifiers_from_columns(['area_cluster_2',
+                                                      'area'])
+        self.assertEqual(['size', 'area', 'area_cluster_2'],
+                         [modifier.get_column() for modifier
+                          in modifier_manager._modifiers])
+        self.assertEqual(['size', 'area', 'half_area', 'area_cluster_2'],
+                         modifier_manager.get_modified_columns())
+        value_points = [value_point for value_point
+                        in modifier_manager.run(self._get_fake_file_data())]
+        self.assertEqual([1800, 1800], [value_point['area']
+                                        for value_point in value_points])
+
+        def circular_modifier(value_point):
+            return value_point
+        circular_modifier.input_fields = ['area']
+        circular_modifier.output_fields = ['size']
+        self.assertRaises(Exception, modifier_manager._get_ordered_columns,
+                          {'area': dummy_package.get_area_modifier(),
+                           'size': circular_modifier})
+
+    def test_can_push_down_filters(self):
+        modifier_manager = ModifierManager()
+        modifier_manager.add_lookup_module('artemisia.test.dummy_package')
+        modifier_manager.add_lookup_module(acluster)
+        self.assertTrue(modifier_manager.can_push_down_filters())
+        modifier_manager.load_modifiers_from_columns(['width_cluster_2',
+                                                      'cluster_3'])
+        self.assertTrue(modifier_manager.can_push_down_filters())
+        # the size modifier does not declare what it alters
+        modifier_manager.load_modifiers_from_columns(['size'])
+        self.assertFalse(modifier_manager.can_push_down_filters())
+
+        def declared_modifier(value_point):
+            return value_point
+        declared_modifier.output_fields = ['width']
+        modifier_manager = ModifierManager()
+        modifier_manager.add_modifier(declared_modifier)
+        # it may still drop value points
+        self.assertFalse(modifier_manager.can_push_down_filters())
+        declared_modifier.keeps_value_points = True
+        modifier_manager = ModifierManager()
+        modifier_manager.add_modifier(declared_modifier)
+        self.assertTrue(modifier_manager.can_push_down_filters())
+
+    def test_modifier_chain(self):
+        def odd_iteration_modifier(value_point):
+            if value_point['iteration'] % 2 == 1:
+                return value_point
+        modifier_manager = ModifierManager()
+        modifier_manager.add_lookup_module('artemisia.test.dummy_package')
+        modifier_manager.add_lookup_module(acluster)
+        modifier_manager.load_modifiers_from_columns(['area', 'cluster_3'])
+        modifier_manager.add_modifier(odd_iteration_modifier)
+        # the modifiers alter their input, each run gets its own data
+        for get_data in [lambda: self._get_fake_file_data(),
+                         lambda: [self._get_fake_file_data()],
+                         lambda: [ValuePointBatch.from_value_points(
+                             self._get_fake_file_data())]]:
+            expected = get_data()
+            for modifier in modifier_manager._modifiers:
+                expected = modifier.run(expected)
+            expected = [element for element in expected]
+            modified = [element for element
+                        in modifier_manager.run(get_data())]
+            if isinstance(modified[0], ValuePointBatch):
+                expected = [expected[0].to_value_points()]
+                modified = [modified[0].to_value_points()]
+            self.assertEqual(expected, modified)
+            self.assertEqual(1, len(modified))
+
+        modifier_manager.add_modifier(odd_iteration_modifier)
+        modifier_manager.add_modifier(lambda value_point: None)
+        self.assertRaisesRegexp(Exception, '<lambda>', list,
+                                modifier_manager.run(
+                                    self._get_fake_file_data()))
+
+    def test_modifier_workers(self):
+        def get_modifier_manager(columns):
+            modifier_manager = ModifierManager()
+            modifier_manager.add_lookup_module('artemisia.test.dummy_package')
+            modifier_manager.add_lookup_module(acluster)
+            modifier_manager.load_modifiers_from_columns(columns)
+            return modifier_manager
+
+        columns = ['area', 'cluster_3', 'odd_iteration']
+        modifier_manager = get_modifier_manager(columns)
+        modifier_manager.set_workers_count(2)
+        modifier_manager._value_points_chunk_size = 1
+        for get_data in [lambda: [value_point for index in range(3)
+                                  for value_point
+                                  in self._get_fake_file_data()],
+                         lambda: [self._get_fake_file_data()
+                                  for index in range(3)],
+                         lambda: [ValuePointBatch.from_value_points(
+                             self._get_fake_file_data())
+                             for index in range(3)]]:
+            expected = [element for element
+                        in get_modifier_manager(columns).run(get_data())]
+            modified = [element for element
+                        in modifier_manager.run(get_data())]
+            if isinstance(modified[0], ValuePointBatch):
+                expected = [batch.to_value_points() for batch in expected]
+                modified = [batch.to_value_points() for batch in modified]
+            self.assertEqual(expected, modified)
+            self.assertEqual(3, len(modified))
+
+        # the normalizers of the parent process are not computed again
+        normalizer._coordinators['data'] = \
+            normalizer.NormalizationCoordinator('data')
+        amodifier._init_worker(modifier_manager.get_specification())
+        self.assertEqual({}, normalizer._coordinators)
+
+        modifier_manager = get_modifier_manager(['failing'])
+        modifier_manager.set_workers_count(2)
+        self.assertRaisesRegexp(Exception, 'worker process(.|\n)*always fails',
+                                list, modifier_manager.run(
+                                    self._get_fake_file_data()))
+
+        modifier_manager = get_modifier_manager(['odd_iteration', 'dropped'])
+        modifier_manager.set_workers_count(2)
+        self.assertRaisesRegexp(Exception, 'dropped_modifier', list,
+                                modifier_manager.run(
+                                    self._get_fake_file_data()))
+
+    def test_stable_hash(self):
+        # the 'f' tag and the float64 bits of 150, mixed and finalized
+        self.assertEqual(0xd307f2c518d3e3b5, acluster.stable_hash(150))
+        self.assertEqual(acluster.stable_hash(150), acluster.stable_hash(150.0))
+        # 'a' == u'a' but their memoized hashes are kept apart
+        self.assertNotEqual(acluster.stable_hash({'room': 'a'}),
+                            acluster.stable_hash({'room': u'a'}))
+
+        value_points = self._get_fake_file_data()
+        value_points[1]['problem'] = None
+        value_points[1]['_file_path'] = 'data.csv'
+        batch = ValuePointBatch.from_value_points(value_points)
+        self.assertEqual([acluster.stable_hash(value_point)
+                          for value_point in batch],
+                         acluster.stable_hash_batch(batch).tolist())
+        for field in ['problem', 'weight']:
+            self.assertEqual([acluster.stable_hash(value_point.get(field))
+                              for value_point in value_points],
+                             acluster.stable_hash_column(
+                                 batch.get_column(field)).tolist())
+
     def _get_fake_file_data(self):
         file_data = [{'problem': 'tsp_solution',
                       'width': 150,
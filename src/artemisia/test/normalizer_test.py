@@ -0,0 +1,163 @@
+import unittest
+import tempfile
+import shutil
+import os
+import multiprocessing
+import numpy
+
+from artemisia.modifier.normalizer import Normalizer, \
+    NormalizationCoordinator
+from artemisia.batch import ValuePointBatch
+
+
+class NormalizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir_path = tempfile.mkdtemp()
+        self._temperatures = {'bedroom': [], 'kitchen': []}
+        for i in range(3):
+            self._write_data_file(i)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir_path)
+        Normalizer.set_cache_dir_path()
+
+    def test_normalize(self):
+        normalizer = self._get_normalizer()
+        value_point = normalizer.normalize({'room': 'kitchen',
+                                            'temperature': 20.0})
+        expected = (20.0 - numpy.mean(self._temperatures['kitchen'])) \
+            / numpy.std(self._temperatures['kitchen'])
+        self.assertAlmostEqual(expected, value_point['normalized_temperature'])
+
+    def test_normalize_batch(self):
+        normalizer = self._get_normalizer()
+        value_points = [{'room': 'kitchen', 'temperature': 20},
+                        {'room': 'bedroom', 'temperature': 17.5},
+                        {'room': 'kitchen', 'temperature': 23}]
+        for with_missing_value in [False, True]:
+            if with_missing_value:
+                value_points.append({'room': 'bedroom'})
+            batch = normalizer.normalize_batch(
+                ValuePointBatch.from_value_points(value_points))
+            expected = [normalizer.normalize(dict(value_point))
+                        for value_point in value_points]
+            self.assertEqual(expected, batch.to_value_points())
+
+        batch = ValuePointBatch.from_value_points(
+            [{'room': 'garage', 'temperature': 20}])
+        self.assertRaisesRegexp(Exception, 'Unknown problem type',
+                                normalizer.normalize_batch, batch)
+
+    def test_incremental_update(self):
+        self._get_normalizer().normalize({'room': 'kitchen',
+                                          'temperature': 20.0})
+        self._write_data_file(3)
+
+        normalizer = self._get_normalizer()
+        read_file_paths = []
+        get_filtered_data = normalizer._get_filtered_data
+
+        def recording_get_filtered_data(file_path):
+            read_file_paths.append(file_path)
+            return get_filtered_data(file_path)
+        normalizer._get_filtered_data = recording_get_filtered_data
+
+        value_point = normalizer.normalize({'room': 'bedroom',
+                                            'temperature': 20.0})
+        self.assertEqual([os.path.join(self._dir_path, 'data3.csv')],
+                         read_file_paths)
+        expected = (20.0 - numpy.mean(self._temperatures['bedroom'])) \
+            / numpy.std(self._temperatures['bedroom'])
+        self.assertAlmostEqual(expected, value_point['normalized_temperature'])
+
+    def test_coordinator(self):
+        coordinator = NormalizationCoordinator(self._dir_path)
+        read_file_paths = []
+        read_file = coordinator._read_file
+
+        def recording_read_file(file_path, normalizers):
+            read_file_paths.append(file_path)
+            return read_file(file_path, normalizers)
+        coordinator._read_file = recording_read_file
+        normalizers = [self._get_normalizer(), self._get_normalizer([])]
+        for normalizer in normalizers:
+            coordinator.add_normalizer(normalizer)
+
+        value_point = normalizers[0].normalize({'room': 'kitchen',
+                                                'temperature': 20.0})
+        self.assertEqual(3, len(read_file_paths))
+        self.assertTrue(normalizers[1].is_loaded())
+        expected = (20.0 - numpy.mean(self._temperatures['kitchen'])) \
+            / numpy.std(self._temperatures['kitchen'])
+        self.assertAlmostEqual(expected, value_point['normalized_temperature'])
+        temperatures = self._temperatures['kitchen'] \
+            + self._temperatures['bedroom']
+        value_point = normalizers[1].normalize({'temperature': 20.0})
+        expected = (20.0 - numpy.mean(temperatures)) / numpy.std(temperatures)
+        self.assertAlmostEqual(expected, value_point['normalized_temperature'])
+
+        self._write_data_file(3)
+        coordinator.add_normalizer(self._get_normalizer())
+        coordinator.add_normalizer(self._get_normalizer([]))
+        coordinator.update()
+        self.assertEqual(os.path.join(self._dir_path, 'data3.csv'),
+                         read_file_paths[-1])
+        self.assertEqual(4, len(read_file_paths))
+
+    def test_concurrent_processes(self):
+        cache_dir_path = os.path.join(self._dir_path, 'cache')
+        Normalizer.set_cache_dir_path(cache_dir_path)
+        pool = multiprocessing.Pool(3)
+        try:
+            read_files_counts = pool.map(_count_read_files,
+                                         [self._dir_path] * 3)
+        finally:
+            pool.terminate()
+            pool.join()
+        # a single process read the data files, the others waited for it
+        self.assertEqual([0, 0, 3], sorted(read_files_counts))
+
+        other_dir_path = os.path.join(self._dir_path, 'other')
+        os.mkdir(other_dir_path)
+        self.assertNotEqual(
+            Normalizer(self._dir_path, 'temperature').get_lock_path(),
+            Normalizer(other_dir_path, 'temperature').get_lock_path())
+        self.assertTrue(Normalizer(self._dir_path, 'temperature')
+                        .get_lock_path().startswith(cache_dir_path))
+
+    def _get_normalizer(self, fixed_fields=None):
+        if fixed_fields is None:
+            fixed_fields = ['room']
+        normalizer = Normalizer(self._dir_path, 'temperature',
+                                fixed_fields=fixed_fields)
+        normalizer._normalization_data_path_pattern = \
+            os.path.join(self._dir_path, 'normalization-%s.data')
+        return normalizer
+
+    def _write_data_file(self, i):
+        file_path = os.path.join(self._dir_path, 'data%d.csv' % i)
+        with open(file_path, 'w') as f:
+            f.write("temperature,room\n")
+            for (room, temperature) in [('bedroom', 18 + i),
+                                        ('kitchen', 21 + 2 * i),
+                                        ('bedroom', 16 - i)]:
+                f.write("%d,%s\n" % (temperature, room))
+                self._temperatures[room].append(temperature)
+
+
+def _count_read_files(dir_path):
+    normalizer = Normalizer(dir_path, 'temperature', fixed_fields=['room'])
+    read_file_paths = []
+    get_filtered_data = normalizer._get_filtered_data
+
+    def recording_get_filtered_data(file_path):
+        read_file_paths.append(file_path)
+        return get_filtered_data(file_path)
+    normalizer._get_filtered_data = recording_get_filtered_data
+    normalizer.normalize({'room': 'kitchen', 'temperature': 20.0})
+    return len(read_file_paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
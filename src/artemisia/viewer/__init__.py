@@ -59,7 +59,7 @@ class Viewer:
 
 
     def _get_aggregate(self, data_generator, axis_columns):
-        aggregator = gaggregator.Aggregator()
+        aggregator = gaggregator.AggregatorFactory().get_aggregator()
         for axis_column in axis_columns:
             if not self._helper.is_sql_function(axis_column):
                 aggregator.add_aggregate_column(axis_column)